@@ -0,0 +1,262 @@
+"""
+Asyncio counterparts of run_step and prompt_model, so many company analyses can share one event loop and one
+connection pool instead of one OS thread per step.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List
+from model_config import MODEL_NAME, SEARCH_CACHE_TTL, LLM_CACHE_TTL, SEARCH_TIMEOUT, HEDGE_REQUESTS, FALLBACK_MODEL_NAME, \
+    EXTRACT_BATCH_SIZE, DOCUMENT_TTL, INDUSTRY_TTL, COMPANY_INDUSTRIES
+from utils import _build_params, _parse_response, log_request, build_search_params, filter_search_results, build_step_prompt, build_condense_prompt, \
+    add_raw_content, get_model_route, model_chain, build_industry_prompt, normalize_industry, get_step, industry_step
+from cache_utils import _async_cached_call, search_cache_key, llm_cache_key, sector_cache_key, document_max_age
+from company_identity import canonical_company_id
+from document_store import async_get_documents, add_documents
+from context_builder import estimate_tokens
+from rate_limiter import async_limited, llm_limiter_names
+from resilience import async_with_retries, async_with_fallbacks, async_hedged_call, latency_tracker
+from log_utils import audit_log
+from tracing import span, annotate
+
+# Global variables for async clients
+async_tavily_client = None
+async_instructorlitellm_client = None
+
+def initialize_async_clients(mock_clients=False):
+    global async_tavily_client, async_instructorlitellm_client
+
+    if mock_clients:
+        async_instructorlitellm_client = _mock_async_instructorlitellm_client()
+        async_tavily_client = _mock_async_tavily_client()
+    else:
+        # imported here, not at module level, so importing this module stays cheap
+        import litellm
+        import instructor
+        from tavily import AsyncTavilyClient
+        async_instructorlitellm_client = instructor.from_litellm(litellm.acompletion)
+        try:
+            async_tavily_client = AsyncTavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+        except KeyError:
+            logging.error("Error initialising async Tavily client. Missing API key?")
+            async_tavily_client = None
+
+def _mock_async_instructorlitellm_client():
+    # Implement mock functionality for async_instructorlitellm_client
+    class MockAsyncInstructorLiteLLM:
+        def __init__(self):
+            self.chat = self
+            self.completions = self
+
+        async def create(self, **kwargs):
+            await asyncio.sleep(3)
+            class MockResponse:
+                def __init__(self):
+                    self.content = 'Mock response from async_instructorlitellm_client'
+                    self.usage = type('MockUsage', (), {
+                        'prompt_tokens': 0,
+                        'completion_tokens': 0,
+                        'total_tokens': 0
+                    })()
+
+                def __getitem__(self, key):
+                    if key == 'choices':
+                        return [{'message': {'content': self.content}}]
+
+            return MockResponse()
+    return MockAsyncInstructorLiteLLM()
+
+def _mock_async_tavily_client():
+    # Implement mock functionality for async_tavily_client
+    class MockAsyncTavilyClient:
+        async def search(self, **kwargs):
+            await asyncio.sleep(1)
+            return {
+                'results': [
+                    {'url': 'https://example1.com', 'content': 'Mock search result content 1'},
+                    {'url': 'https://example2.com', 'content': 'Mock search result content 2'},
+                    {'url': 'https://example3.com', 'content': 'Mock search result content 3'}
+                ]
+            }
+
+        async def extract(self, urls, **kwargs):
+            await asyncio.sleep(1)
+            return {'results': [{'url': url, 'raw_content': f'Mock raw content of {url}'} for url in urls], 'failed_results': []}
+    return MockAsyncTavilyClient()
+
+async def async_prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None,
+                             hedge: bool = True, **kwargs) -> str:
+    """
+    Async version of utils.prompt_model using litellm's async completion.
+
+    Args:
+        prompt (str): The input prompt for the API.
+        max_tokens (int, optional): The maximum number of tokens in the response. Defaults to 1024.
+        role (str, optional): The role of the message sender. Defaults to "user".
+        response_model (optional): The response model to use. Defaults to None.
+        hedge (bool, optional): With HEDGE_REQUESTS, race a slow call against FALLBACK_MODEL_NAME. Defaults to True.
+
+    Returns:
+        str: The raw response from the LLM API.
+    """
+    params = _build_params(prompt, max_tokens, role, response_model=response_model, **kwargs)
+    log_request(params)
+
+    async def call(model: str):
+        return await async_with_retries(lambda: _async_complete({**params, "model": model}), f"LLM call to {model}")
+
+    with span("llm", model=kwargs.get("model", MODEL_NAME), streamed=False):
+        if hedge and HEDGE_REQUESTS and FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != params["model"]:
+            resp = await async_hedged_call(lambda: call(params["model"]), lambda: call(FALLBACK_MODEL_NAME),
+                                           latency_tracker.hedge_delay(params["model"]), f"LLM call to {params['model']}")
+        else:
+            resp = await call(params["model"])
+        return _parse_response(resp, response_model)
+
+async def _async_complete(params: Dict):
+    async with async_limited(llm_limiter_names(params["model"]), estimate_tokens(params["messages"][0]["content"]) + params["max_tokens"]) as permit:
+        annotate(rate_limit_wait=round(permit.waited, 3))
+        start_time = time.monotonic()
+        resp = await async_instructorlitellm_client.chat.completions.create(**params)
+        latency_tracker.record(params["model"], time.monotonic() - start_time)
+        permit.used_tokens = resp.usage.total_tokens
+    return resp
+
+async def async_search_web(search_params: Dict) -> Dict:
+    """
+    Async version of utils.search_web using Tavily's async client.
+
+    Args:
+        search_params (Dict): The search parameters, see utils.build_search_params.
+
+    Returns:
+        Dict: The filtered search results.
+    """
+    async def search():
+        async with async_limited(["tavily"]) as permit:
+            annotate(rate_limit_wait=round(permit.waited, 3))
+            return await async_tavily_client.search(**search_params, timeout=SEARCH_TIMEOUT)
+
+    with span("search", query=search_params["query"]) as search_span:
+        search_results = filter_search_results(search_params, await async_with_retries(search, "Tavily search"))
+        search_span.attributes["results"] = len(search_results["results"])
+    return search_results
+
+async def async_extract_pages(urls: List[str]) -> Dict[str, str]:
+    """
+    Async version of utils.extract_pages; batches are fetched concurrently.
+
+    Args:
+        urls (List[str]): The page URLs.
+
+    Returns:
+        Dict[str, str]: The raw content by URL; pages that couldn't be fetched are missing.
+    """
+    async def extract(batch: List[str]):
+        async with async_limited(["tavily"]) as permit:
+            annotate(rate_limit_wait=round(permit.waited, 3))
+            return await async_tavily_client.extract(urls=batch, timeout=SEARCH_TIMEOUT)
+
+    pages = {}
+    with span("extract", urls=len(urls)) as extract_span:
+        responses = await asyncio.gather(*(async_with_retries(lambda batch=urls[i:i + EXTRACT_BATCH_SIZE]: extract(batch), "Tavily extract")
+                                           for i in range(0, len(urls), EXTRACT_BATCH_SIZE)))
+        for response in responses:
+            pages.update({result["url"]: result.get("raw_content") or "" for result in response.get("results", [])})
+            for failed in response.get("failed_results", []):
+                logging.warning(f"Could not fetch {failed.get('url')}: {failed.get('error')}")
+        extract_span.attributes["fetched"] = len(pages)
+    logging.info(f"Fetched {len(pages)}/{len(urls)} pages: {[(url, len(raw_content)) for url, raw_content in pages.items()]}")
+    audit_log("extracted_pages", pages)
+    return pages
+
+async def async_run_step(step: Dict[str, str], company_url: str) -> str:
+    """
+    Async version of utils.run_step.
+
+    Args:
+        step (Dict[str, str]): A dictionary containing step information.
+        company_url (str): The URL of the company being analyzed.
+
+    Returns:
+        str: The result of the step.
+    """
+    if step.get("scope") == "industry":
+        step = industry_step(step, canonical_company_id(company_url))
+    search_results = await async_search_web(build_search_params(step, company_url))
+    search_results = add_raw_content(search_results, await async_extract_pages([result["url"] for result in search_results["results"]]))
+    prompt = build_step_prompt(step, search_results)
+    route = get_model_route("step", step)
+    return await async_with_fallbacks(lambda model: async_prompt_model(prompt, route["max_tokens"], model=model, temperature=route["temperature"]),
+                                      model_chain(route["model"], route["fallbacks"]), f"Step {step['step_name']}")
+
+async def async_cached_search(search_params: Dict, cache_ttl: float = SEARCH_CACHE_TTL) -> Dict:
+    return await _async_cached_call(search_cache_key(search_params), lambda: async_search_web(search_params), expire=cache_ttl)
+
+async def async_cached_prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None,
+                                    cache_ttl: float = LLM_CACHE_TTL, fallbacks: List[str] = (), **kwargs) -> str:
+    # one cache key per model of the fallback chain, as in cache_utils.cached_prompt_model
+    models = model_chain(kwargs.pop("model", MODEL_NAME), fallbacks)
+    async def cached_call(model: str) -> str:
+        key = llm_cache_key(prompt, max_tokens, role, response_model, model=model, **kwargs)
+        return await _async_cached_call(key, lambda: async_prompt_model(prompt, max_tokens, role, response_model, hedge=False,
+                                                                        model=model, **kwargs),
+                                        expire=cache_ttl)
+    def shielded_call(model: str):
+        # async_hedged_call cancels the loser; shielded, the losing model's call still finishes and caches its answer
+        # (as with the sync hedged_call), and callers coalesced on it aren't cancelled along with it
+        task = asyncio.ensure_future(cached_call(model))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return asyncio.shield(task)
+    async def call(model: str) -> str:
+        if HEDGE_REQUESTS and FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != model:
+            return await async_hedged_call(lambda: shielded_call(model), lambda: shielded_call(FALLBACK_MODEL_NAME),
+                                           latency_tracker.hedge_delay(model), f"LLM call to {model}")
+        return await cached_call(model)
+    return await async_with_fallbacks(call, models, "LLM call")
+
+async def async_cached_run_step(step: Dict[str, str], company_url: str) -> str:
+    # same cache layers and freshness policy as cache_utils.cached_run_step, so sync and async runs share entries
+    with span("step", step_name=step["step_name"]):
+        if step.get("scope") == "industry":
+            return await _async_cached_run_sector_step(step, company_url)
+        return await _async_cached_run_step(step, company_url)
+
+async def _async_cached_run_step(step: Dict[str, str], company_url: str) -> str:
+    step_ttl = step.get("cache_ttl", LLM_CACHE_TTL)
+    search_results = await async_cached_search(build_search_params(step, company_url), cache_ttl=min(SEARCH_CACHE_TTL, step_ttl))
+    documents = await async_get_documents([result["url"] for result in search_results["results"]],
+                                          max_age=document_max_age(min(DOCUMENT_TTL, step_ttl)))
+    search_results = add_documents(search_results, documents)
+    return await async_cached_prompt_model(build_step_prompt(step, search_results), cache_ttl=step_ttl, **get_model_route("step", step))
+
+async def _async_cached_run_sector_step(step: Dict[str, str], company_url: str) -> str:
+    industry = await async_cached_classify_industry(step, company_url)
+    annotate(industry=industry)
+    if not industry:
+        return await _async_cached_run_step(industry_step(step, canonical_company_id(company_url)), company_url)
+    sector_step = industry_step(step, industry)
+    return await _async_cached_call(sector_cache_key(sector_step), lambda: _async_cached_run_step(sector_step, ""),
+                                    expire=step.get("sector_ttl", INDUSTRY_TTL))
+
+async def async_cached_classify_industry(step: Dict[str, str], company_url: str) -> str:
+    """Async version of cache_utils.cached_classify_industry."""
+    company_id = canonical_company_id(company_url)
+    if company_id in COMPANY_INDUSTRIES:
+        return normalize_industry(COMPANY_INDUSTRIES[company_id])
+    with span("classify_industry") as classify_span:
+        try:
+            overview = await async_cached_run_step(get_step(step["industry_from"]), company_id)
+            industry = normalize_industry(await async_cached_prompt_model(build_industry_prompt(overview), **get_model_route("classify_industry")))
+        except Exception as e:
+            logging.error(f"Error classifying the industry of {company_id}: {str(e)}")
+            industry = ""
+        classify_span.attributes["industry"] = industry
+    logging.info(f"Industry of {company_id}: {industry or 'unknown'}")
+    return industry
+
+async def async_cached_condense_step(step: Dict[str, str], step_result: str) -> str:
+    with span("condense", step_name=step["step_name"]):
+        return await async_cached_prompt_model(build_condense_prompt(step, step_result), cache_ttl=step.get("cache_ttl", LLM_CACHE_TTL),
+                                               **get_model_route("condense"))
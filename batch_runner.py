@@ -0,0 +1,335 @@
+"""
+Headless batch mode for the company research workflow.
+
+Runs every workflow step, the summary and the draft email for a list of company URLs on a
+bounded thread pool and writes one JSON record per company to a JSONL file. Companies are identified by their
+company ID (see company_identity.py), so different spellings of one company's URL are analyzed once.
+
+Usage:
+    python batch_runner.py companies.txt --output results.jsonl --max-workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Executor
+from typing import Dict, List, Optional, Set, Tuple
+
+from workflow_steps import WORKFLOW_STEPS
+from utils import initialize_clients, build_summary_prompt, build_draft_email_prompt, get_model_route
+from company_identity import canonical_company_id
+from model_config import INCREMENTAL_SUMMARY, METRICS_PORT, METRICS_FILE
+from rate_limiter import get_rate_limiter_stats
+from document_store import get_document_store_stats
+from tracing import Trace, use_trace, span, submit_traced, start_metrics_server, write_metrics_file
+from cache_utils import cached_prompt_model, cached_run_step, cached_condense_step, get_cache_stats
+from async_utils import async_cached_prompt_model, async_cached_run_step, async_cached_condense_step, initialize_async_clients
+
+DEFAULT_MAX_WORKERS = 4  # max. concurrent provider calls (searches and completions) across all companies
+DEFAULT_MAX_COMPANIES = 4  # max. companies in flight at the same time
+
+def read_company_urls(path: str) -> List[str]:
+    """
+    Read company URLs from a text file, one per line; blank lines and lines starting with '#' are ignored.
+
+    Args:
+        path (str): Path to the input file.
+
+    Returns:
+        List[str]: The company URLs in file order, without duplicates (URLs with the same company ID) and URLs without a host.
+    """
+    company_urls = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            company_url = line.strip()
+            if not company_url or company_url.startswith("#"):
+                continue
+            company_id = canonical_company_id(company_url)
+            if company_id and company_id not in seen:
+                seen.add(company_id)
+                company_urls.append(company_url)
+    return company_urls
+
+def read_completed_company_ids(path: str) -> Set[str]:
+    """
+    Read the IDs of the companies that already have a successful record in an existing output file.
+
+    Args:
+        path (str): Path to the JSONL output file.
+
+    Returns:
+        Set[str]: The company IDs to skip when resuming.
+    """
+    completed = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "ok":  # records written before company IDs only have the URL
+                    completed.add(record.get("company_id") or canonical_company_id(record["company_url"]))
+    except FileNotFoundError:
+        pass
+    return completed
+
+def _run_and_condense_step(step: Dict, company_url: str) -> Tuple[str, str]:
+    # condense right after the step finishes so the final summary only has to reduce short notes
+    result = cached_run_step(step, company_url)
+    if not INCREMENTAL_SUMMARY:
+        return result, ""
+    try:
+        return result, cached_condense_step(step, result)
+    except Exception as e:
+        logging.error(f"Error condensing step {step['step_name']} for {company_url}: {str(e)}")
+        return result, ""
+
+async def _async_run_and_condense_step(step: Dict, company_url: str) -> Tuple[str, str]:
+    result = await async_cached_run_step(step, company_url)
+    if not INCREMENTAL_SUMMARY:
+        return result, ""
+    try:
+        return result, await async_cached_condense_step(step, result)
+    except Exception as e:
+        logging.error(f"Error condensing step {step['step_name']} for {company_url}: {str(e)}")
+        return result, ""
+
+def _run_stage(stage: str, fn, *args, **kwargs):
+    with span(stage):
+        return fn(*args, **kwargs)
+
+def _new_record(company_url: str) -> Dict:
+    # the URL as given, and the company ID that all searches, caches and resuming use
+    return {"company_url": company_url, "company_id": canonical_company_id(company_url), "steps": [], "summary": "",
+            "draft_email": "", "status": "ok"}
+
+def _add_step_result(record: Dict, step_index: int, step: Dict, outcome):
+    # outcome is the (result, condensed) tuple of the step or the exception raised by the step; with
+    # return_exceptions=True gather also returns a cancelled step's CancelledError, which is no Exception
+    if isinstance(outcome, BaseException):
+        error = str(outcome) or type(outcome).__name__
+        logging.error(f"Error in step {step_index} for {record['company_url']}: {error}")
+        record["steps"].append({"step_name": step["step_name"], "result": f"Error occurred during step {step_index}.", "condensed": "", "error": error})
+        record["status"] = "error"
+    else:
+        result, condensed = outcome
+        record["steps"].append({"step_name": step["step_name"], "result": result, "condensed": condensed, "error": None})
+
+def _successful_step_results(record: Dict) -> List[str]:
+    # condensed versions where available (map-reduce), full results otherwise
+    step_results = [step["condensed"] or step["result"] for step in record["steps"] if step["error"] is None]
+    if not step_results:
+        record["status"] = "error"
+        record["error"] = "No step results to summarize."
+    return step_results
+
+def _set_summary_error(record: Dict, e: Exception):
+    logging.error(f"Error in summary or draft email for {record['company_url']}: {str(e)}")
+    record["status"] = "error"
+    record["error"] = str(e)
+
+def analyze_company(company_url: str, executor: Executor, trace: Optional[Trace] = None) -> Dict:
+    """
+    Run the full workflow for one company, submitting every provider call to the shared executor.
+
+    Args:
+        company_url (str): The URL of the company being analyzed.
+        executor (Executor): The bounded executor shared by all companies.
+        trace (Trace, optional): The trace to record the spans in, e.g. to keep them for a benchmark. Defaults to a new one.
+
+    Returns:
+        Dict: The result record for the company.
+    """
+    start_time = time.time()
+    record = _new_record(company_url)
+    trace = trace or Trace(record["company_id"])
+
+    with use_trace(trace):
+        step_futures = [submit_traced(executor, _run_and_condense_step, step, record["company_id"]) for step in WORKFLOW_STEPS]
+        for step_index, (step, future) in enumerate(zip(WORKFLOW_STEPS, step_futures)):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = e
+            _add_step_result(record, step_index, step, outcome)
+
+        step_results = _successful_step_results(record)
+        if step_results:
+            try:
+                record["summary"] = submit_traced(executor, _run_stage, "summary", cached_prompt_model, build_summary_prompt(step_results),
+                                                  **get_model_route("summary")).result()
+                record["draft_email"] = submit_traced(executor, _run_stage, "draft_email", cached_prompt_model,
+                                                      build_draft_email_prompt(record["summary"]), **get_model_route("draft_email")).result()
+            except Exception as e:
+                _set_summary_error(record, e)
+
+    record["elapsed_seconds"] = round(time.time() - start_time, 2)
+    record["trace"] = trace.summary()
+    return record
+
+async def async_analyze_company(company_url: str, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Async version of analyze_company: the step fan-out, summary and draft email run on the current event loop.
+
+    Args:
+        company_url (str): The URL of the company being analyzed.
+        semaphore (asyncio.Semaphore): Bounds concurrent provider calls across all companies.
+
+    Returns:
+        Dict: The result record for the company.
+    """
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    start_time = time.time()
+    record = _new_record(company_url)
+    trace = Trace(record["company_id"])
+
+    with use_trace(trace):
+        outcomes = await asyncio.gather(*(bounded(_async_run_and_condense_step(step, record["company_id"])) for step in WORKFLOW_STEPS),
+                                        return_exceptions=True)
+        for step_index, (step, outcome) in enumerate(zip(WORKFLOW_STEPS, outcomes)):
+            _add_step_result(record, step_index, step, outcome)
+
+        step_results = _successful_step_results(record)
+        if step_results:
+            try:
+                with span("summary"):
+                    record["summary"] = await bounded(async_cached_prompt_model(build_summary_prompt(step_results), **get_model_route("summary")))
+                with span("draft_email"):
+                    record["draft_email"] = await bounded(async_cached_prompt_model(build_draft_email_prompt(record["summary"]), **get_model_route("draft_email")))
+            except Exception as e:
+                _set_summary_error(record, e)
+
+    record["elapsed_seconds"] = round(time.time() - start_time, 2)
+    record["trace"] = trace.summary()
+    return record
+
+def _pending_company_urls(company_urls: List[str], output_path: str, resume: bool) -> List[str]:
+    if not resume:
+        return company_urls
+    completed = read_completed_company_ids(output_path)
+    logging.info(f"Resuming batch: skipping {len(completed)} completed companies")
+    return [company_url for company_url in company_urls if canonical_company_id(company_url) not in completed]
+
+def _write_record(output_file, record: Dict, records: List[Dict], total: int):
+    output_file.write(json.dumps(record) + "\n")
+    output_file.flush()
+    records.append(record)
+    logging.info(f"Batch progress: {len(records)}/{total} companies done ({record['company_url']}: {record['status']})")
+
+def run_batch(company_urls: List[str], output_path: str, max_workers: int = DEFAULT_MAX_WORKERS,
+              max_companies: int = DEFAULT_MAX_COMPANIES, resume: bool = False) -> List[Dict]:
+    """
+    Analyze many companies with a bounded number of concurrent provider calls.
+
+    Records are appended to the output file as soon as each company finishes, so an interrupted
+    run can be continued with resume=True.
+
+    Args:
+        company_urls (List[str]): The company URLs to analyze.
+        output_path (str): Path to the JSONL output file.
+        max_workers (int, optional): Max. concurrent searches and completions. Defaults to DEFAULT_MAX_WORKERS.
+        max_companies (int, optional): Max. companies in flight at the same time. Defaults to DEFAULT_MAX_COMPANIES.
+        resume (bool, optional): Skip companies that already have a successful record. Defaults to False.
+
+    Returns:
+        List[Dict]: The result records written in this run.
+    """
+    company_urls = _pending_company_urls(company_urls, output_path, resume)
+    records = []
+    write_lock = threading.Lock()
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-call") as executor, \
+            ThreadPoolExecutor(max_workers=max_companies, thread_name_prefix="batch-company") as company_executor:
+
+        def process_company(company_url: str):
+            record = analyze_company(company_url, executor)
+            with write_lock:
+                _write_record(output_file, record, records, len(company_urls))
+
+        for future in [company_executor.submit(process_company, company_url) for company_url in company_urls]:
+            future.result()
+
+    return records
+
+async def run_batch_async(company_urls: List[str], output_path: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                          max_companies: int = DEFAULT_MAX_COMPANIES, resume: bool = False) -> List[Dict]:
+    """
+    Async version of run_batch: all companies share one event loop and connection pool instead of threads.
+    Requires async_utils.initialize_async_clients.
+
+    Args:
+        company_urls (List[str]): The company URLs to analyze.
+        output_path (str): Path to the JSONL output file.
+        max_workers (int, optional): Max. concurrent searches and completions. Defaults to DEFAULT_MAX_WORKERS.
+        max_companies (int, optional): Max. companies in flight at the same time. Defaults to DEFAULT_MAX_COMPANIES.
+        resume (bool, optional): Skip companies that already have a successful record. Defaults to False.
+
+    Returns:
+        List[Dict]: The result records written in this run.
+    """
+    company_urls = _pending_company_urls(company_urls, output_path, resume)
+    records = []
+    call_semaphore = asyncio.Semaphore(max_workers)
+    company_semaphore = asyncio.Semaphore(max_companies)
+
+    async def process_company(company_url: str) -> Dict:
+        async with company_semaphore:
+            return await async_analyze_company(company_url, call_semaphore)
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as output_file:
+        for next_done in asyncio.as_completed([process_company(company_url) for company_url in company_urls]):
+            _write_record(output_file, await next_done, records, len(company_urls))
+    return records
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the company research workflow for a file of company URLs.")
+    parser.add_argument("input", help="text file with one company URL per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL file to write one record per company to")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="max. concurrent searches and completions")
+    parser.add_argument("--max-companies", type=int, default=DEFAULT_MAX_COMPANIES, help="max. companies in flight at the same time")
+    parser.add_argument("--resume", action="store_true", help="append to the output file and skip companies already done")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads", help="run provider calls on a thread pool or one event loop")
+    clients = parser.add_mutually_exclusive_group()
+    clients.add_argument("--mock", action="store_true", help="use mock clients instead of the real providers")
+    clients.add_argument("--record-fixtures", metavar="DIR", help="save all provider responses to this fixture directory (threads engine)")
+    clients.add_argument("--replay-fixtures", metavar="DIR", help="serve provider responses from this fixture directory instead of calling the providers (threads engine)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, help="write per-stage latency/token/cost metrics (Prometheus text format) to this file")
+    args = parser.parse_args(argv)
+
+    from env_config import setup_environment, setup_logging
+    setup_environment()
+    setup_logging()
+    fixtures_dir = args.record_fixtures or args.replay_fixtures
+    if fixtures_dir and args.engine == "async":
+        parser.error("--record-fixtures and --replay-fixtures need --engine threads")
+    initialize_clients(mock_clients=args.mock, fixtures_mode=("record" if args.record_fixtures else "replay") if fixtures_dir else None,
+                       fixtures_dir=fixtures_dir)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    company_urls = read_company_urls(args.input)
+    if args.engine == "async":
+        initialize_async_clients(mock_clients=args.mock)
+        records = asyncio.run(run_batch_async(company_urls, args.output, max_workers=args.max_workers,
+                                              max_companies=args.max_companies, resume=args.resume))
+    else:
+        records = run_batch(company_urls, args.output, max_workers=args.max_workers,
+                            max_companies=args.max_companies, resume=args.resume)
+    failed = sum(1 for record in records if record["status"] != "ok")
+    logging.info(f"Batch finished: {len(records)} companies, {failed} with errors, results in {args.output}")
+    logging.info(f"Cache statistics: {get_cache_stats()}")
+    logging.info(f"Rate limiter statistics: {get_rate_limiter_stats()}")
+    logging.info(f"Document store statistics: {get_document_store_stats()}")
+    if args.metrics_file:
+        write_metrics_file(args.metrics_file)
+        logging.info(f"Metrics written to {args.metrics_file}")
+
+if __name__ == "__main__":
+    main()
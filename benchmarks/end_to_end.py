@@ -0,0 +1,203 @@
+"""
+End-to-end benchmark of the company research workflow on replayed provider responses.
+
+Runs the full workflow (steps with condensing, summary, draft email) and the PDF report for a list of companies, as
+batch_runner.py does, against fixtures recorded with
+    python batch_runner.py companies.txt --record-fixtures fixtures
+with provider latency drawn from REPLAY_LATENCY (see fixtures.py). Every company is run twice, on an empty cache
+(cold) and again on the filled one (warm), and per-stage latency (p50/p95/max), throughput (companies per minute),
+peak memory (tracemalloc, this process) and prompt tokens per stage are reported. With --baseline (the --output of an
+earlier run) it exits with status 1 if a stage's p50 latency or the throughput regressed by more than --max-regression.
+
+Usage:
+    python -m benchmarks.end_to_end companies.txt --fixtures fixtures [--latency-scale 1.0] [--seed 0]
+        [--output bench.json] [--baseline bench.json] [--max-regression 0.2]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import resource
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+STAGES = ["step", "condense", "summary", "draft_email", "generate_pdf", "search", "extract", "build_context", "llm"]
+TOKEN_STAGES = ["step", "condense", "summary", "draft_email"]  # prompt tokens are attributed to the enclosing one of these
+MIN_REGRESSION_SECONDS = 0.05  # smaller p50 differences are noise
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+def _prompt_tokens_by_stage(spans: List[Dict]) -> Dict[str, int]:
+    by_id = {span["span_id"]: span for span in spans}
+    tokens = {}
+    for span in spans:
+        if span["name"] != "llm" or not span.get("input_tokens"):
+            continue
+        parent = by_id.get(span["parent_id"])
+        while parent is not None and parent["name"] not in TOKEN_STAGES:
+            parent = by_id.get(parent["parent_id"])
+        stage = parent["name"] if parent is not None else "other"
+        tokens[stage] = tokens.get(stage, 0) + span["input_tokens"]
+    return tokens
+
+def _stage_stats(spans: List[Dict], companies: int) -> Dict[str, Dict]:
+    tokens = _prompt_tokens_by_stage(spans)
+    stats = {}
+    for stage in STAGES + sorted(set(tokens) - set(STAGES)):
+        durations = [span["duration"] for span in spans if span["name"] == stage]
+        if not durations and stage not in tokens:
+            continue
+        stats[stage] = {"count": len(durations),
+                        "p50": round(percentile(durations, 50), 4) if durations else None,
+                        "p95": round(percentile(durations, 95), 4) if durations else None,
+                        "max": round(max(durations), 4) if durations else None,
+                        "errors": sum(1 for span in spans if span["name"] == stage and (span["error"] is not None or span.get("failed"))),
+                        "prompt_tokens_per_company": round(tokens.get(stage, 0) / companies, 1)}
+    return stats
+
+def run_pass(company_urls: List[str], max_workers: int, max_companies: int, trace_memory: bool) -> Dict:
+    """
+    Analyze all companies and render their PDF reports, like batch_runner.run_batch.
+
+    Args:
+        company_urls (List[str]): The companies.
+        max_workers (int): Max. concurrent searches and completions.
+        max_companies (int): Max. companies in flight at the same time.
+        trace_memory (bool): Measure peak memory with tracemalloc (slows Python code down).
+
+    Returns:
+        Dict: Throughput, memory, errors and per-stage statistics.
+    """
+    from batch_runner import analyze_company
+    from workflow_steps import WORKFLOW_STEPS
+    from pdf_report import get_pdf_future
+    from tracing import Trace, use_trace
+
+    def process(company_url: str, executor) -> Tuple[Dict, Trace]:
+        trace = Trace(company_url)
+        record = analyze_company(company_url, executor, trace)
+        with use_trace(trace):
+            future = get_pdf_future([step["step_name"] for step in WORKFLOW_STEPS], [step["result"] for step in record["steps"]],
+                                    record["summary"], record["draft_email"])
+        recorded = threading.Event()  # callbacks run in order, so the report's generate_pdf span is in the trace by then
+        future.add_done_callback(lambda _: recorded.set())
+        recorded.wait()
+        return record, trace
+
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bench-call") as executor, \
+            ThreadPoolExecutor(max_workers=max_companies, thread_name_prefix="bench-company") as company_executor:
+        results = list(company_executor.map(lambda company_url: process(company_url, executor), company_urls))
+    elapsed = time.perf_counter() - start_time
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    spans = [span for _, trace in results for span in trace.to_list()]
+    return {"companies": len(company_urls), "seconds": round(elapsed, 3),
+            "companies_per_minute": round(len(company_urls) / elapsed * 60, 2),
+            "company_errors": sum(1 for record, _ in results if record["status"] != "ok"),
+            "peak_memory_mb": round(peak_memory / 1024 ** 2, 1) if peak_memory is not None else None,
+            "stages": _stage_stats(spans, len(company_urls))}
+
+def compare(result: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """
+    List the regressions of a benchmark result against a baseline result.
+
+    Args:
+        result (Dict): The benchmark result.
+        baseline (Dict): An earlier result.
+        max_regression (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        List[str]: The regressions, empty if there are none.
+    """
+    regressions = []
+    for pass_name, current in result["passes"].items():
+        previous = baseline.get("passes", {}).get(pass_name)
+        if previous is None:
+            continue
+        if current["companies_per_minute"] < previous["companies_per_minute"] / (1 + max_regression):
+            regressions.append(f"{pass_name}: throughput {previous['companies_per_minute']} -> {current['companies_per_minute']} companies/min")
+        for stage, stats in current["stages"].items():
+            old = previous["stages"].get(stage, {}).get("p50")
+            new = stats["p50"]
+            if old is not None and new is not None and new > old * (1 + max_regression) and new - old > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{pass_name}: {stage} p50 {old:.3f}s -> {new:.3f}s")
+    return regressions
+
+def print_result(result: Dict):
+    for pass_name, stats in result["passes"].items():
+        memory = f", peak memory {stats['peak_memory_mb']} MB" if stats["peak_memory_mb"] is not None else ""
+        print(f"\n{pass_name}: {stats['companies']} companies in {stats['seconds']:.1f}s "
+              f"({stats['companies_per_minute']} companies/min){memory}, {stats['company_errors']} with errors")
+        print(f"{'stage':<16}{'count':>7}{'p50 s':>9}{'p95 s':>9}{'max s':>9}{'errors':>8}{'prompt tokens/company':>24}")
+        for stage, stage_stats in stats["stages"].items():
+            times = "".join(f"{stage_stats[key]:>9.3f}" if stage_stats[key] is not None else f"{'-':>9}" for key in ("p50", "p95", "max"))
+            print(f"{stage:<16}{stage_stats['count']:>7}{times}{stage_stats['errors']:>8}{stage_stats['prompt_tokens_per_company']:>24}")
+    print(f"\nPDF worker peak RSS: {result['pdf_worker_peak_rss_mb']} MB")
+    print(f"Fixtures: {result['replay']}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the workflow end to end on recorded provider responses.")
+    parser.add_argument("input", help="text file with one company URL per line (the companies the fixtures were recorded for)")
+    parser.add_argument("--fixtures", default=None, help="fixture directory (default: FIXTURES_DIR)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="factor for the replayed provider latencies; 0 measures local work only")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the replayed latencies")
+    parser.add_argument("--max-workers", type=int, default=4, help="max. concurrent searches and completions")
+    parser.add_argument("--max-companies", type=int, default=4, help="max. companies in flight at the same time")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows Python code down")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    # settings read at import time: a fresh cache per benchmark, and the replay latency model
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ.update({"CACHE_DIR": cache_dir, "REPLAY_LATENCY_SCALE": str(args.latency_scale), "REPLAY_SEED": str(args.seed)})
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+
+    from model_config import FIXTURES_DIR
+    from utils import initialize_clients
+    from batch_runner import read_company_urls
+    from fixtures import get_replay_stats
+    from pdf_report import shutdown as shutdown_pdf_worker
+
+    fixtures_dir = args.fixtures or FIXTURES_DIR
+    initialize_clients(fixtures_mode="replay", fixtures_dir=fixtures_dir)
+    company_urls = read_company_urls(args.input)
+    result = {"config": {"companies": len(company_urls), "fixtures": fixtures_dir, "latency_scale": args.latency_scale,
+                         "seed": args.seed, "max_workers": args.max_workers, "max_companies": args.max_companies},
+              "passes": {}}
+    for pass_name in ("cold", "warm"):
+        result["passes"][pass_name] = run_pass(company_urls, args.max_workers, args.max_companies, not args.no_memory)
+    result["replay"] = get_replay_stats()
+    shutdown_pdf_worker()  # its peak memory is only reported once it has exited
+    result["pdf_worker_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    print_result(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Import-time benchmark for app startup.
+
+Measures, in fresh interpreters, how long importing the modules streamlit_app.py loads at startup takes now that
+litellm, instructor, tavily and weasyprint are deferred, compared with also importing those dependencies (what every
+cold start paid before), and checks that none of them is still pulled in eagerly.
+
+Usage:
+    python -m benchmarks.import_time [--repeat 5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what streamlit_app.py imports before the page renders (streamlit itself is listed separately)
+APP_MODULES = ["workflow_steps", "env_config", "utils", "model_config", "rate_limiter", "tracing", "job_queue", "company_identity", "pdf_report",
+               "cache_utils", "document_store", "prefetch"]
+DEFERRED_MODULES = ["litellm", "instructor", "tavily", "weasyprint"]
+
+_MEASURE = """
+import sys, time, json
+start = time.perf_counter()
+failed = []
+for name in {modules!r}:
+    try:
+        __import__(name)
+    except Exception:
+        failed.append(name)
+print(json.dumps({{"seconds": time.perf_counter() - start, "failed": failed,
+                  "loaded_deferred": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+def measure(modules: List[str], repeat: int) -> Dict:
+    """
+    Import modules in a fresh interpreter, repeat times.
+
+    Args:
+        modules (List[str]): The modules to import, in order.
+        repeat (int): Number of fresh interpreters to measure.
+
+    Returns:
+        Dict: The median and min. seconds, modules that failed to import and deferred modules that got loaded.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _MEASURE.format(modules=modules, deferred=DEFERRED_MODULES)],
+                                cwd=REPO_DIR, capture_output=True, text=True, check=True,
+                                env={**os.environ, "LITELLM_LOCAL_MODEL_COST_MAP": "True"})
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    seconds = [run["seconds"] for run in runs]
+    return {"median": statistics.median(seconds), "min": min(seconds), "failed": runs[-1]["failed"], "loaded_deferred": runs[-1]["loaded_deferred"]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app startup import time with and without the deferred dependencies.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args(argv)
+
+    rows = [("streamlit", measure(["streamlit"], args.repeat)),
+            ("app modules (startup now)", measure(["streamlit"] + APP_MODULES, args.repeat)),
+            ("app modules + deferred deps (startup before)", measure(["streamlit"] + APP_MODULES + DEFERRED_MODULES, args.repeat))]
+    rows += [(f"  {name} alone", measure([name], args.repeat)) for name in DEFERRED_MODULES]
+
+    print(f"{'import':<48}{'median s':>10}{'min s':>10}")
+    for name, result in rows:
+        note = f"  (failed: {', '.join(result['failed'])})" if result["failed"] else ""
+        print(f"{name:<48}{result['median']:>10.3f}{result['min']:>10.3f}{note}")
+
+    now, before = rows[1][1], rows[2][1]
+    print(f"\nStartup import time saved: {before['median'] - now['median']:.3f}s ({1 - now['median'] / before['median']:.0%})")
+    if now["loaded_deferred"]:
+        print(f"Warning: still imported at startup: {', '.join(now['loaded_deferred'])}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
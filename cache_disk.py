@@ -0,0 +1,51 @@
+"""
+Compact on-disk serialization for the diskcache caches.
+
+Values are pickled and compressed (zstd if the zstandard package is installed, zlib otherwise) before diskcache stores
+them, so LLM outputs and page content take a fraction of the space in SQLite and the cache directory. Every stored
+value starts with a one-byte codec tag; values written before compression was introduced are read as they are.
+"""
+import zlib
+import pickle
+from diskcache import Disk, UNKNOWN
+from model_config import CACHE_COMPRESSION_LEVEL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MIN_COMPRESS_BYTES = 256  # smaller values (locks, counters) are only pickled
+
+_PLAIN, _ZLIB, _ZSTD = b"P", b"Z", b"S"
+_CODECS = (_PLAIN, _ZLIB, _ZSTD)
+
+def compress(data: bytes) -> bytes:
+    if len(data) < MIN_COMPRESS_BYTES:
+        return _PLAIN + data
+    if zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=CACHE_COMPRESSION_LEVEL).compress(data)
+    return _ZLIB + zlib.compress(data, CACHE_COMPRESSION_LEVEL)
+
+def decompress(data: bytes) -> bytes:
+    codec, payload = data[:1], data[1:]
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Cache entry is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == _ZLIB:
+        return zlib.decompress(payload)
+    return payload
+
+class CompressedDisk(Disk):
+    """diskcache Disk that stores values as compressed pickles; keys are stored as usual."""
+    def store(self, value, read, key=UNKNOWN):
+        if not read:
+            value = compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        return super().store(value, read, key=key)
+
+    def fetch(self, mode, filename, value, read):
+        data = super().fetch(mode, filename, value, read)
+        if not read and isinstance(data, bytes) and data[:1] in _CODECS:
+            return pickle.loads(decompress(data))
+        return data  # written before compression was introduced
@@ -0,0 +1,418 @@
+"""
+Disk cache for slow/expensive calls, split into two layers:
+- search layer: Tavily responses (without page content, see document_store.py) keyed by normalized query, include_domains
+  and depth, with their own TTL
+- analysis layer: LLM completions keyed by the model that gave them (see MODEL_ROUTES), its settings and the prompt
+- sector layer: results of industry-scoped steps, keyed by industry and shared by all companies in it (INDUSTRY_TTL)
+
+Editing a prompt_to_analyse or switching models therefore only re-runs the LLM call against cached search results.
+The cache is size-bounded (RESULT_CACHE_SIZE_LIMIT, CACHE_EVICTION_POLICY) and entries expire per step ("cache_ttl").
+Concurrent identical calls (other threads, sessions or processes) are coalesced into a single computation.
+Within refresh_expiring(), entries that would expire within the given window count as misses and are recomputed
+(cache warming, see warm_cache.py).
+Keys are stored as (layer, sha256 digest) and values compressed (see cache_disk.py); caches written before that are
+converted with:
+    python cache_utils.py migrate
+"""
+import os
+import sys
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Dict, List, Tuple, Callable, Any, Optional, Awaitable
+from diskcache import Cache
+from cache_disk import CompressedDisk
+from model_config import MODEL_NAME, DOCUMENT_TTL, CACHE_DIR, RESULT_CACHE_SIZE_LIMIT, CACHE_EVICTION_POLICY, SEARCH_CACHE_TTL, LLM_CACHE_TTL, \
+    SINGLE_FLIGHT_TIMEOUT, SINGLE_FLIGHT_POLL_INTERVAL, INDUSTRY_TTL, COMPANY_INDUSTRIES, HEDGE_REQUESTS, FALLBACK_MODEL_NAME
+from tracing import span, annotate
+from resilience import with_fallbacks, hedged_call, latency_tracker
+from utils import prompt_model, search_web, build_search_params, build_step_prompt, build_condense_prompt, get_model_route, model_chain, \
+    build_industry_prompt, normalize_industry, get_step, industry_step
+from company_identity import canonical_company_id
+from document_store import get_documents, add_documents
+
+# cull_limit=0 disables culling inside set() so evictions can be counted via the explicit cull() in _cached_call
+cache = Cache(CACHE_DIR, size_limit=RESULT_CACHE_SIZE_LIMIT, eviction_policy=CACHE_EVICTION_POLICY, cull_limit=0, disk=CompressedDisk)
+
+_MISSING = object()
+_ACQUIRED = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+# Single-flight: concurrent identical calls wait for one computation instead of each paying for it.
+# Within a process, followers wait on the leader's future; across processes, the leader holds a lock entry in the
+# cache itself and other processes poll until the value appears (or the lock expires because the leader died).
+_inflight: Dict[Tuple, Future] = {}
+_inflight_lock = threading.Lock()
+_async_inflight: Dict[Tuple, asyncio.Future] = {}
+
+_refresh = contextvars.ContextVar("refresh", default=None)  # see refresh_expiring
+
+class _Refresh:
+    def __init__(self, window: float):
+        self.window = window
+        self.started_at = time.time()
+        self.refreshed = set()  # keys stored since, fresh however short their TTL
+
+def _count(stat: str, n: int = 1):
+    with _stats_lock:
+        _stats[stat] += n
+
+def _lock_key(key: Tuple) -> Tuple:
+    return ("lock",) + key
+
+@contextmanager
+def refresh_expiring(window: float):
+    """
+    Treat cached entries (and stored documents) that expire within window seconds as missing, so the calls made in
+    this context (and in executor threads started with submit_traced) refresh them; each entry once.
+
+    Args:
+        window (float): Seconds; e.g. the time until the next cache warming run.
+    """
+    token = _refresh.set(_Refresh(window))
+    try:
+        yield
+    finally:
+        _refresh.reset(token)
+
+def document_max_age(max_age: float) -> float:
+    # within refresh_expiring, documents must still be fresh after the window, unless fetched during the refresh
+    refresh = _refresh.get()
+    return max_age if refresh is None else max(max_age - refresh.window, time.time() - refresh.started_at)
+
+def _get(key: Tuple) -> Any:
+    refresh = _refresh.get()
+    if refresh is None or key in refresh.refreshed:
+        return cache.get(key, default=_MISSING)
+    value, expire_time = cache.get(key, default=_MISSING, expire_time=True)
+    if value is not _MISSING and expire_time is not None and expire_time - time.time() < refresh.window:
+        return _MISSING
+    return value
+
+def _claim(key: Tuple) -> Any:
+    # one polling round: the value if another process stored it meanwhile, _ACQUIRED if we got the lock, else _MISSING
+    value = _get(key)
+    if value is not _MISSING:
+        return value
+    if cache.add(_lock_key(key), os.getpid(), expire=SINGLE_FLIGHT_TIMEOUT):
+        return _ACQUIRED
+    return _MISSING
+
+def _claim_or_wait(key: Tuple) -> Any:
+    deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+    while (value := _claim(key)) is _MISSING and time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+    return value  # still _MISSING after the timeout: compute without the lock rather than fail
+
+async def _async_claim_or_wait(key: Tuple) -> Any:
+    deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+    while (value := _claim(key)) is _MISSING and time.monotonic() < deadline:
+        await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+    return value
+
+def _cached_call(key: Tuple, compute: Callable[[], Any], expire: Optional[float] = None) -> Any:
+    layer = key[0]
+    value = _lookup(key)
+    if value is not _MISSING:
+        _count(f"{layer}_hits")
+        return value
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _inflight[key] = Future()
+    if not is_leader:
+        _count(f"{layer}_coalesced")
+        with span("single_flight_wait", layer=layer):
+            return future.result()
+
+    try:
+        with span("single_flight_wait", layer=layer):
+            claim = _claim_or_wait(key)
+        if claim is _ACQUIRED or claim is _MISSING:
+            try:
+                _count(f"{layer}_misses")
+                value = compute()
+                _store(key, value, expire)
+            finally:
+                if claim is _ACQUIRED:
+                    cache.delete(_lock_key(key))
+        else:
+            _count(f"{layer}_coalesced")  # computed by another process
+            value = claim
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _lookup(key: Tuple) -> Any:
+    with span(f"cache.{key[0]}") as lookup_span:
+        value = _get(key)
+        lookup_span.attributes["cache_hit"] = value is not _MISSING
+    return value
+
+def _store(key: Tuple, value: Any, expire: Optional[float]):
+    cache.set(key, value, expire=expire)
+    if _refresh.get() is not None:
+        _refresh.get().refreshed.add(key)
+    evicted = cache.cull()  # removes expired entries, then evicts until under RESULT_CACHE_SIZE_LIMIT
+    if evicted:
+        _count("evictions", evicted)
+        logging.info(f"Cache evicted {evicted} entries")
+
+async def _async_cached_call(key: Tuple, compute: Callable[[], Awaitable[Any]], expire: Optional[float] = None) -> Any:
+    # diskcache is synchronous, but local SQLite reads/writes take well under a millisecond, so no executor hop
+    layer = key[0]
+    value = _lookup(key)
+    if value is not _MISSING:
+        _count(f"{layer}_hits")
+        return value
+
+    # asyncio futures are bound to their loop, so in-process coalescing is per loop; other loops and threads
+    # coalesce through the cache lock
+    inflight_key = (id(asyncio.get_running_loop()),) + key
+    future = _async_inflight.get(inflight_key)
+    if future is not None:
+        _count(f"{layer}_coalesced")
+        with span("single_flight_wait", layer=layer):
+            return await asyncio.shield(future)
+    future = _async_inflight[inflight_key] = asyncio.get_running_loop().create_future()
+
+    try:
+        with span("single_flight_wait", layer=layer):
+            claim = await _async_claim_or_wait(key)
+        if claim is _ACQUIRED or claim is _MISSING:
+            try:
+                _count(f"{layer}_misses")
+                value = await compute()
+                _store(key, value, expire)
+            finally:
+                if claim is _ACQUIRED:
+                    cache.delete(_lock_key(key))
+        else:
+            _count(f"{layer}_coalesced")
+            value = claim
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark as retrieved so asyncio doesn't warn when there were no followers
+        raise
+    finally:
+        _async_inflight.pop(inflight_key, None)
+
+def get_cache_stats() -> Dict:
+    """
+    Get hit, miss and eviction counters for this process plus the current size of the cache.
+
+    Returns:
+        Dict: The cache statistics.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = sum(v for k, v in stats.items() if k.endswith("_hits"))
+    misses = sum(v for k, v in stats.items() if k.endswith("_misses"))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "coalesced": sum(v for k, v in stats.items() if k.endswith("_coalesced")),
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "evictions": stats.get("evictions", 0),
+        "by_layer": {k: v for k, v in stats.items() if k != "evictions"},
+        "entries": len(cache),
+        "size_bytes": cache.volume(),
+        "size_limit_bytes": RESULT_CACHE_SIZE_LIMIT,
+        "eviction_policy": CACHE_EVICTION_POLICY,
+        "directory": CACHE_DIR,
+    }
+
+_LAYERS = ("search", "llm", "sector")
+
+def compact_key(parts: Tuple) -> Tuple[str, str]:
+    """
+    Turn a full key (layer, prompt, model, params...) into (layer, sha256 hex digest of the rest), so the SQLite index
+    stores 64 characters per entry instead of whole prompts.
+
+    Args:
+        parts (Tuple): The full key; its first element is the cache layer.
+
+    Returns:
+        Tuple[str, str]: The compact key.
+    """
+    return (parts[0], hashlib.sha256(repr(parts[1:]).encode("utf-8")).hexdigest())
+
+def _is_compact(key: Any) -> bool:
+    return isinstance(key, tuple) and len(key) == 2 and isinstance(key[1], str) and len(key[1]) == 64
+
+def search_cache_key(search_params: Dict) -> Tuple:
+    """
+    Build the search-layer cache key; queries differing only in case or whitespace share a key.
+
+    Args:
+        search_params (Dict): The search parameters, see utils.build_search_params.
+
+    Returns:
+        Tuple: The cache key.
+    """
+    query = " ".join(search_params["query"].lower().split())
+    include_domains = tuple(sorted({domain.strip().lower() for domain in search_params.get("include_domains", [])}))
+    other_params = tuple(sorted((k, tuple(sorted(v)) if isinstance(v, list) else v) for k, v in search_params.items()
+                                if k not in ("query", "include_domains", "search_depth")))
+    return compact_key(("search", query, include_domains, search_params.get("search_depth", "basic"), other_params))
+
+def cached_search(search_params: Dict, cache_ttl: Optional[float] = SEARCH_CACHE_TTL) -> Dict:
+    return _cached_call(search_cache_key(search_params), lambda: search_web(search_params), expire=cache_ttl)
+
+def llm_cache_key(prompt: str, max_tokens: int, role: str, response_model, **kwargs) -> Tuple:
+    return compact_key(("llm", kwargs.get("model", MODEL_NAME), prompt, max_tokens, role,
+                        getattr(response_model, "__name__", None), tuple(sorted((k, v) for k, v in kwargs.items() if k != "model"))))
+
+def cached_prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None,
+                        cache_ttl: Optional[float] = LLM_CACHE_TTL, on_partial: Optional[Callable[[str], None]] = None,
+                        fallbacks: List[str] = (), **kwargs) -> str:
+    # on_partial only affects delivery (streaming), not the result, so it's not part of the key; the final text is cached.
+    # Each model of the fallback chain has its own key: an answer is cached under the model that gave it, and a
+    # fallback's cached answer is reused while the primary model keeps failing. For the same reason hedging happens
+    # here rather than in prompt_model: each side of the race is a cached call under its own model's key.
+    models = model_chain(kwargs.pop("model", MODEL_NAME), fallbacks)
+    def cached_call(model: str) -> str:
+        key = llm_cache_key(prompt, max_tokens, role, response_model, model=model, **kwargs)
+        return _cached_call(key, lambda: prompt_model(prompt, max_tokens, role, response_model, on_partial=on_partial, model=model,
+                                                      hedge=False, **kwargs),
+                            expire=cache_ttl)
+    def call(model: str) -> str:
+        # streamed calls aren't hedged, as in prompt_model
+        if HEDGE_REQUESTS and FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != model and (on_partial is None or response_model is not None):
+            return hedged_call(lambda: cached_call(model), lambda: cached_call(FALLBACK_MODEL_NAME),
+                               latency_tracker.hedge_delay(model), f"LLM call to {model}")
+        return cached_call(model)
+    return with_fallbacks(call, models, "LLM call")
+
+def sector_cache_key(sector_step: Dict) -> Tuple:
+    # the industry is part of the step's query and prompt; the route, so a different model doesn't reuse the result
+    route = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in get_model_route("step", sector_step).items()))
+    return compact_key(("sector", sector_step["search_query"], sector_step["prompt_to_analyse"],
+                        tuple(sorted(sector_step.get("include_domains", []))), route))
+
+def cached_run_step(step: Dict[str, str], company_url: str, on_partial: Optional[Callable[[str], None]] = None) -> str:
+    with span("step", step_name=step["step_name"]):
+        if step.get("scope") == "industry":
+            return _cached_run_sector_step(step, company_url, on_partial)
+        return _cached_run_step(step, company_url, on_partial)
+
+def _cached_run_step(step: Dict[str, str], company_url: str, on_partial: Optional[Callable[[str], None]]) -> str:
+    step_ttl = step.get("cache_ttl", LLM_CACHE_TTL)
+    # search results must not outlive the step's freshness policy, otherwise re-analysis would reuse stale news
+    search_results = cached_search(build_search_params(step, company_url), cache_ttl=min(SEARCH_CACHE_TTL, step_ttl))
+    # page content comes from the shared document store, so pages found by several steps are fetched once
+    documents = get_documents([result["url"] for result in search_results["results"]],
+                              max_age=document_max_age(min(DOCUMENT_TTL, step_ttl)))
+    search_results = add_documents(search_results, documents)
+    return cached_prompt_model(build_step_prompt(step, search_results), cache_ttl=step_ttl, on_partial=on_partial,
+                               **get_model_route("step", step))
+
+def _cached_run_sector_step(step: Dict[str, str], company_url: str, on_partial: Optional[Callable[[str], None]]) -> str:
+    industry = cached_classify_industry(step, company_url)
+    annotate(industry=industry)
+    if not industry:  # research the company's own industry, not shared with other companies
+        return _cached_run_step(industry_step(step, canonical_company_id(company_url)), company_url, on_partial)
+    sector_step = industry_step(step, industry)
+    # company_url "" keeps the sector's pages out of the company's corpus
+    return _cached_call(sector_cache_key(sector_step), lambda: _cached_run_step(sector_step, "", on_partial),
+                        expire=step.get("sector_ttl", INDUSTRY_TTL))
+
+def cached_classify_industry(step: Dict[str, str], company_url: str) -> str:
+    """
+    Classify a company into the industry its sector-level results are shared under: from COMPANY_INDUSTRIES, or by
+    the classify_industry model from the result of the step's "industry_from" step (which is cached, so this reuses
+    or joins that step's run).
+
+    Args:
+        step (Dict[str, str]): The industry-scoped step.
+        company_url (str): The URL of the company.
+
+    Returns:
+        str: The industry key, e.g. "hr software"; "" if it couldn't be determined.
+    """
+    company_id = canonical_company_id(company_url)
+    if company_id in COMPANY_INDUSTRIES:
+        return normalize_industry(COMPANY_INDUSTRIES[company_id])
+    with span("classify_industry") as classify_span:
+        try:
+            overview = cached_run_step(get_step(step["industry_from"]), company_id)
+            industry = normalize_industry(cached_prompt_model(build_industry_prompt(overview), **get_model_route("classify_industry")))
+        except Exception as e:
+            logging.error(f"Error classifying the industry of {company_id}: {str(e)}")
+            industry = ""
+        classify_span.attributes["industry"] = industry
+    logging.info(f"Industry of {company_id}: {industry or 'unknown'}")
+    return industry
+
+def cached_condense_step(step: Dict[str, str], step_result: str) -> str:
+    with span("condense", step_name=step["step_name"]):
+        return cached_prompt_model(build_condense_prompt(step, step_result), cache_ttl=step.get("cache_ttl", LLM_CACHE_TTL),
+                                   **get_model_route("condense"))
+
+def _migrated_key(key: Tuple) -> Optional[Tuple]:
+    # full (uncompacted) keys of this cache's layers
+    if key[0] in _LAYERS:
+        return compact_key(key)
+    # the first version's @cache.memoize()d streamlit_app.cached_prompt_model: (module.function, *args, None, *kwargs),
+    # computed with MODEL_NAME and the default parameters unless given
+    if isinstance(key[0], str) and key[0].endswith(".cached_prompt_model"):
+        for i in range(2, min(len(key), 6)):
+            names = key[i + 1::2]
+            if key[i] is None and (len(key) - i) % 2 == 1 and all(isinstance(name, str) for name in names):
+                args = key[1:i] + (1024, "user", None)[i - 2:]
+                return llm_cache_key(*args, **dict(zip(names, key[i + 2::2])))
+    return None
+
+def migrate_cache() -> Dict[str, int]:
+    """
+    Convert entries written by earlier versions: re-keyed to their compact key (so they are hit again) and re-stored
+    compressed with their remaining expiry. This covers full keys of the search and LLM layers and the first version's
+    memoized cached_prompt_model completions (keyed under MODEL_NAME). Its memoized cached_run_step results are dropped:
+    steps now prompt with ranked page passages, so a whole-step result has no equivalent key. Stale single-flight locks
+    are dropped as well.
+
+    Returns:
+        Dict[str, int]: Counts of migrated, dropped and already compact entries.
+    """
+    counts = Counter()
+    for key in list(cache.iterkeys()):
+        if _is_compact(key) or not isinstance(key, tuple) or not key:
+            counts["compact"] += 1
+            continue
+        new_key = _migrated_key(key)
+        if new_key is None:
+            cache.delete(key)
+            counts["dropped"] += 1
+            continue
+        value, expire_time = cache.get(key, default=_MISSING, expire_time=True)
+        if value is not _MISSING:
+            remaining = None if expire_time is None else expire_time - time.time()
+            if remaining is None or remaining > 0:
+                cache.set(new_key, value, expire=remaining)
+                counts["migrated"] += 1
+        cache.delete(key)
+    cache.cull()
+    return dict(counts)
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("Usage: python cache_utils.py migrate")
+    before = cache.volume()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    logging.info(f"Cache migration: {migrate_cache()}, {before} -> {cache.volume()} bytes in {CACHE_DIR}")
@@ -0,0 +1,92 @@
+"""
+Company identity: every spelling of a company's URL is reduced to one company ID, so that `acme.com`,
+`https://www.acme.com/` and `ACME.com/about` share their searches, completions, documents and batch records.
+
+The ID is the company's lowercase host without scheme, "www.", port, path, query or trailing dot. Aliases
+(COMPANY_ALIASES and the JSON object in COMPANY_ALIASES_FILE, alias -> ID, e.g. old domains or country domains) map
+further IDs to one; with RESOLVE_COMPANY_REDIRECTS the company's homepage is also requested once per process and the
+host it redirects to is used.
+"""
+import json
+import logging
+import threading
+import urllib.request
+from functools import lru_cache
+from typing import Dict
+from urllib.parse import urlsplit
+from model_config import COMPANY_ALIASES, COMPANY_ALIASES_FILE, RESOLVE_COMPANY_REDIRECTS, COMPANY_REDIRECT_TIMEOUT
+
+_aliases = None
+_aliases_lock = threading.Lock()
+
+def normalize_company_url(company_url: str) -> str:
+    """
+    Reduce a company URL to its bare host: lowercase, without scheme, "www.", port, path, query or trailing dot.
+
+    Args:
+        company_url (str): The URL as entered, e.g. "https://www.Acme.com/about".
+
+    Returns:
+        str: The host, e.g. "acme.com"; "" if there is none or the URL is malformed (e.g. "http://[acme").
+    """
+    company_url = company_url.strip()
+    if "://" not in company_url:
+        company_url = "//" + company_url  # urlsplit only finds the host after a scheme or "//"
+    try:
+        host = (urlsplit(company_url).hostname or "").rstrip(".")
+    except ValueError:  # e.g. an unclosed IPv6 bracket
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+def get_aliases() -> Dict[str, str]:
+    """Get the alias -> company ID mapping from COMPANY_ALIASES and COMPANY_ALIASES_FILE (read once)."""
+    global _aliases
+    with _aliases_lock:
+        if _aliases is None:
+            aliases = dict(COMPANY_ALIASES)
+            if COMPANY_ALIASES_FILE:
+                try:
+                    with open(COMPANY_ALIASES_FILE, encoding="utf-8") as f:
+                        aliases.update(json.load(f))
+                except (OSError, ValueError) as e:
+                    logging.error(f"Error reading company aliases from {COMPANY_ALIASES_FILE}: {str(e)}")
+            _aliases = {normalize_company_url(alias): normalize_company_url(company_id) for alias, company_id in aliases.items()}
+        return _aliases
+
+def _resolve_alias(company_id: str) -> str:
+    aliases = get_aliases()
+    seen = {company_id}
+    while company_id in aliases and aliases[company_id] not in seen:  # chains (a -> b -> c) resolve fully, cycles stop
+        company_id = aliases[company_id]
+        seen.add(company_id)
+    return company_id
+
+@lru_cache(maxsize=4096)
+def _resolve_redirect(company_id: str) -> str:
+    request = urllib.request.Request(f"https://{company_id}", method="HEAD", headers={"User-Agent": "Mozilla/5.0"})
+    try:
+        with urllib.request.urlopen(request, timeout=COMPANY_REDIRECT_TIMEOUT) as response:
+            redirected = normalize_company_url(response.geturl())
+    except Exception as e:
+        logging.warning(f"Could not resolve redirects of {company_id}: {str(e)}")
+        return company_id
+    if redirected and redirected != company_id:
+        logging.info(f"Company {company_id} redirects to {redirected}")
+        return redirected
+    return company_id
+
+def canonical_company_id(company_url: str) -> str:
+    """
+    Get the company ID that keys a company's caches, document corpus, job runs and batch records, and is
+    interpolated into the steps' search queries and include_domains.
+
+    Args:
+        company_url (str): The URL as entered.
+
+    Returns:
+        str: The company ID, e.g. "acme.com"; "" if the URL has no host.
+    """
+    company_id = _resolve_alias(normalize_company_url(company_url))
+    if RESOLVE_COMPANY_REDIRECTS and company_id:
+        company_id = _resolve_alias(_resolve_redirect(company_id))
+    return company_id
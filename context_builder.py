@@ -0,0 +1,158 @@
+"""
+Turns raw Tavily search results into compact prompt context: clean text per result, boilerplate and duplicate
+passages removed, and the whole fitted into a per-step token budget.
+"""
+import re
+import hashlib
+from typing import Dict, List, Optional
+from passage_ranking import rank_passages
+
+CHARS_PER_TOKEN = 4  # rough average for English text; good enough for budgeting without a model-specific tokenizer
+MIN_PASSAGE_CHARS = 200  # short paragraphs are merged with their neighbours up to this size
+MAX_PASSAGE_CHARS = 1200  # long paragraphs are split so results can take turns in small portions
+
+_BOILERPLATE_PATTERNS = re.compile(
+    r"cookie|privacy policy|terms of (use|service)|all rights reserved|©|\bcopyright\b|sign (in|up)|log ?in\b|"
+    r"subscribe|newsletter|skip to (main )?content|accept all|javascript|follow us|share (this|on)",
+    re.IGNORECASE,
+)
+_NAV_ITEM = re.compile(
+    r"home|menu|about( us)?|contact( us)?|products?|solutions|services|pricing|careers|jobs|blog|news|search|"
+    r"back to top|read more|learn more|show more|more|next|previous|close",
+    re.IGNORECASE,
+)
+_MENU_SEPARATOR = re.compile(r"\s*[|•·»]\s*")
+_MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_BARE_URL = re.compile(r"https?://\S+")
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _is_link_list(line: str) -> bool:
+    # menus, breadcrumbs and footers: mostly link text, or short items between separators ("Home | Products | Blog")
+    link_texts = _MARKDOWN_LINK.findall(line)
+    if link_texts:
+        return len(_MARKDOWN_LINK.sub("", line).strip(" |•·»,/-")) < sum(len(text) for text in link_texts)
+    items = [item for item in _MENU_SEPARATOR.split(line) if item]
+    return len(items) >= 3 and all(len(item.split()) <= 3 for item in items) and not any(ch.isdigit() for ch in line)
+
+def _is_boilerplate(line: str) -> bool:
+    # line still has its markdown links; short lines are only dropped when they're navigation, as they can hold facts
+    # ("Founded in 2015", "Series B, $40M")
+    if _NAV_ITEM.fullmatch(line) or _is_link_list(line):
+        return True
+    text = _MARKDOWN_LINK.sub(r"\1", line)
+    return len(text.split()) <= 12 and bool(_BOILERPLATE_PATTERNS.search(text))
+
+def clean_text(text: str) -> str:
+    """
+    Strip markup remnants and boilerplate lines from page text.
+
+    Args:
+        text (str): The raw page text.
+
+    Returns:
+        str: The cleaned text, paragraphs separated by blank lines.
+    """
+    text = _MARKDOWN_IMAGE.sub("", text)
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", text):
+        lines = [" ".join(line.strip(" #*|-_>\t").split()) for line in block.splitlines()]
+        lines = [_BARE_URL.sub("", _MARKDOWN_LINK.sub(r"\1", line)) for line in lines if line and not _is_boilerplate(line)]
+        lines = [" ".join(line.split()) for line in lines if line.strip()]
+        if lines:
+            paragraphs.append(" ".join(lines))
+    return "\n\n".join(paragraphs)
+
+def split_passages(text: str) -> List[str]:
+    """
+    Split cleaned text into passages, merging short paragraphs and splitting long ones at sentence ends.
+
+    Args:
+        text (str): The cleaned text, see clean_text.
+
+    Returns:
+        List[str]: The passages in document order.
+    """
+    passages = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        current = f"{current} {paragraph}".strip()
+        while len(current) > MAX_PASSAGE_CHARS:
+            cut = current.rfind(". ", MIN_PASSAGE_CHARS, MAX_PASSAGE_CHARS) + 1
+            if cut <= 0:
+                cut = current.rfind(" ", MIN_PASSAGE_CHARS, MAX_PASSAGE_CHARS)
+            if cut <= 0:
+                cut = MAX_PASSAGE_CHARS
+            passages.append(current[:cut].strip())
+            current = current[cut:].strip()
+        if len(current) >= MIN_PASSAGE_CHARS:
+            passages.append(current)
+            current = ""
+    if current:
+        passages.append(current)
+    return passages
+
+def _fingerprint(passage: str) -> str:
+    normalized = re.sub(r"\W+", " ", passage.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def build_context(search_results: Dict, token_budget: int, query: Optional[str] = None, top_k: Optional[int] = None) -> str:
+    """
+    Assemble prompt context from search results within a token budget.
+
+    With a query, passages from all results are ranked by BM25 and only the top_k most relevant ones are
+    considered. Without one, each result contributes its search snippet first, then passages from its raw
+    content, with results taking turns so a single long page cannot crowd out the others. Passages seen
+    before (on any page) are skipped.
+
+    Args:
+        search_results (Dict): The search results, see utils.search_web.
+        token_budget (int): The max. number of tokens for the context.
+        query (str, optional): The question to rank passages against. Defaults to None.
+        top_k (int, optional): The max. number of passages when ranking. Defaults to None (no limit).
+
+    Returns:
+        str: The context, one section per result headed by its title and URL, passages in page order.
+    """
+    seen = set()
+    headers = []
+    candidates = []  # (result index, position within result, passage)
+    for result in search_results.get("results", []):
+        position = 0
+        for text in (result.get("content") or "", result.get("raw_content") or ""):
+            for passage in split_passages(clean_text(text)):
+                fingerprint = _fingerprint(passage)
+                if fingerprint not in seen:
+                    seen.add(fingerprint)
+                    candidates.append((len(headers), position, passage))
+                    position += 1
+        if position:
+            headers.append(f"[{len(headers) + 1}] {result.get('title', '')} - {result['url']}".strip())
+
+    if query:
+        order = [candidates[i] for i in rank_passages([passage for _, _, passage in candidates], query, top_k or len(candidates))]
+    else:
+        order = sorted(candidates, key=lambda candidate: (candidate[1], candidate[0]))  # round-robin across results
+
+    selected = []
+    remaining = token_budget
+    used_headers = set()
+    for result_index, position, passage in order:
+        header_tokens = 0 if result_index in used_headers else estimate_tokens(headers[result_index]) + 1
+        tokens = estimate_tokens(passage) + header_tokens
+        if tokens > remaining:
+            if remaining - header_tokens < MIN_PASSAGE_CHARS // CHARS_PER_TOKEN:
+                continue  # a smaller passage further down may still fit
+            passage = passage[:(remaining - header_tokens) * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " ..."
+            tokens = remaining
+        used_headers.add(result_index)
+        selected.append((result_index, position, passage))
+        remaining -= tokens
+
+    sections = []
+    for result_index in sorted(used_headers):
+        passages = [passage for index, _, passage in sorted(selected) if index == result_index]
+        sections.append(headers[result_index] + "\n" + "\n".join(passages))
+    return "\n\n".join(sections)
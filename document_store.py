@@ -0,0 +1,166 @@
+"""
+Document store: raw page content fetched once and shared by all workflow steps, runs and companies.
+
+Steps search without raw content; the pages a search finds are then read from the store, and only missing or stale
+ones are fetched (Tavily extract). A company's about or product pages are therefore downloaded once rather than by
+every step that finds them, and concurrent steps finding the same page wait for one fetch. Documents are keyed by
+normalized URL and carry a content hash, so identical pages under different URLs are only sent to the model once.
+"""
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit, urlunsplit
+from diskcache import Cache
+from cache_disk import CompressedDisk
+from model_config import DOCUMENT_STORE_DIR, DOCUMENT_TTL, DOCUMENT_STORE_SIZE_LIMIT, CACHE_EVICTION_POLICY
+from utils import extract_pages
+
+store = Cache(DOCUMENT_STORE_DIR, size_limit=DOCUMENT_STORE_SIZE_LIMIT, eviction_policy=CACHE_EVICTION_POLICY, disk=CompressedDisk)
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_inflight: Dict[str, Future] = {}  # normalized URL -> future of its document (None if the fetch failed)
+_inflight_lock = threading.Lock()
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme and host, drop the fragment and a trailing slash, so variants of a URL share one document."""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def _doc_key(url: str) -> Tuple:
+    return ("doc", url)
+
+def _count(stat: str, n: int = 1):
+    with _stats_lock:
+        _stats[stat] += n
+
+def _claim(urls: List[str], max_age: float) -> Tuple[Dict[str, Dict], Dict[str, Future], Dict[str, Future]]:
+    # splits normalized URLs into stored documents, fetches in flight elsewhere (wait) and fetches we now own
+    found, waiting, owned = {}, {}, {}
+    now = time.time()
+    for url in urls:
+        doc = store.get(_doc_key(url))
+        if doc is not None and now - doc["fetched_at"] <= max_age:
+            found[url] = doc
+            continue
+        with _inflight_lock:
+            future = _inflight.get(url)
+            if future is None:
+                owned[url] = _inflight[url] = Future()
+            else:
+                waiting[url] = future
+    _count("hits", len(found))
+    _count("coalesced", len(waiting))
+    return found, waiting, owned
+
+def _complete(owned: Dict[str, Future], pages: Dict[str, str]) -> Dict[str, Dict]:
+    fetched = {}
+    for url, future in owned.items():
+        raw_content = pages.get(url)
+        doc = None
+        if raw_content:
+            doc = {"url": url, "raw_content": raw_content, "content_hash": content_hash(raw_content), "fetched_at": time.time()}
+            store.set(_doc_key(url), doc, expire=DOCUMENT_TTL)
+            fetched[url] = doc
+        with _inflight_lock:
+            _inflight.pop(url, None)
+        future.set_result(doc)
+    _count("fetched", len(fetched))
+    _count("failed", len(owned) - len(fetched))
+    return fetched
+
+def _fetched_by_url(pages: Dict[str, str]) -> Dict[str, str]:
+    return {normalize_url(url): raw_content for url, raw_content in pages.items()}
+
+def get_documents(urls: List[str], max_age: float = DOCUMENT_TTL) -> Dict[str, Dict]:
+    """
+    Get the documents for the given URLs, fetching only those not in the store (or older than max_age).
+
+    Args:
+        urls (List[str]): The page URLs.
+        max_age (float, optional): Max. age in seconds of stored documents. Defaults to DOCUMENT_TTL.
+
+    Returns:
+        Dict[str, Dict]: The documents (url, raw_content, content_hash, fetched_at) by normalized URL; pages that
+            couldn't be fetched are missing.
+    """
+    originals = {normalize_url(url): url for url in reversed(urls)}  # fetch the URL as found, the first if variants
+    found, waiting, owned = _claim(list(originals), max_age)
+    if owned:
+        pages = {}
+        try:
+            pages = _fetched_by_url(extract_pages([originals[url] for url in owned]))
+        except Exception as e:
+            # the step can still use the search snippets
+            logging.error(f"Error fetching page content: {str(e)}")
+        finally:
+            found.update(_complete(owned, pages))  # also releases the URLs to waiting callers
+    for url, future in waiting.items():
+        doc = future.result()
+        if doc is not None:
+            found[url] = doc
+    return found
+
+async def async_get_documents(urls: List[str], max_age: float = DOCUMENT_TTL) -> Dict[str, Dict]:
+    """Async version of get_documents; coalesces with fetches in flight in threads and other event loops."""
+    from async_utils import async_extract_pages
+
+    originals = {normalize_url(url): url for url in reversed(urls)}  # fetch the URL as found, the first if variants
+    found, waiting, owned = _claim(list(originals), max_age)
+    if owned:
+        pages = {}
+        try:
+            pages = _fetched_by_url(await async_extract_pages([originals[url] for url in owned]))
+        except Exception as e:
+            # the step can still use the search snippets
+            logging.error(f"Error fetching page content: {str(e)}")
+        finally:
+            found.update(_complete(owned, pages))  # also releases the URLs to waiting callers
+    for url, future in waiting.items():
+        doc = await asyncio.wrap_future(future)
+        if doc is not None:
+            found[url] = doc
+    return found
+
+def add_documents(search_results: Dict, documents: Dict[str, Dict]) -> Dict:
+    """
+    Attach stored raw content to search results (fetched without it) and drop results whose content duplicates
+    an earlier result's.
+
+    Args:
+        search_results (Dict): The search results, see utils.search_web.
+        documents (Dict[str, Dict]): The documents by normalized URL, see get_documents.
+
+    Returns:
+        Dict: A copy of the search results with raw_content filled in where available.
+    """
+    results, seen_hashes = [], set()
+    for result in search_results["results"]:
+        doc = documents.get(normalize_url(result["url"]))
+        if doc is not None:
+            if doc["content_hash"] in seen_hashes:
+                continue
+            seen_hashes.add(doc["content_hash"])
+            result = {**result, "raw_content": doc["raw_content"]}
+        results.append(result)
+    return {**search_results, "results": results}
+
+def get_document_store_stats() -> Dict:
+    """
+    Get the document store's counters for this process plus its current size.
+
+    Returns:
+        Dict: Documents served from the store (hits), waited for (coalesced), fetched and failed, entries and bytes.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    return {**stats, "entries": len(store), "size_bytes": store.volume(), "size_limit_bytes": DOCUMENT_STORE_SIZE_LIMIT,
+            "directory": DOCUMENT_STORE_DIR}
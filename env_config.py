@@ -19,22 +19,9 @@ def setup_environment():
 # Configure logging
 def setup_logging(debug_mode=False):
     import logging
-    from logging import StreamHandler, FileHandler
-    # Remove any existing handlers from the root logger
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s', handlers=[])
-    logger = logging.getLogger()
-    # File handler
-    file_handler = logging.FileHandler('llm_qa.log')
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    logger.addHandler(file_handler)
-    # Stream handler for console output
-    stream_handler = StreamHandler()
-    stream_handler.setLevel(logging.INFO)
-    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    logger.addHandler(stream_handler)
+    from log_utils import start_logging
+    # JSON lines to a size-rotated file plus console output, written by a background thread; see log_utils.py
+    start_logging(logging.INFO)
 
     if debug_mode:
         #logger.setLevel(logging.DEBUG) #DO NOT CHANGE, CAUSES ISSUES WITH STREAMLIT
@@ -0,0 +1,355 @@
+"""
+Record/replay of provider responses, for offline runs and reproducible benchmarks.
+
+Recording wraps the real Tavily and litellm clients and writes every search, page extract and completion (with its
+latency and token usage) to a fixture directory, one JSON file per request. Replay serves those fixtures through
+clients with the same interface, so prompt assembly, caching, threading, streaming and cost accounting run exactly
+as in production, while provider latency is drawn from the distributions in REPLAY_LATENCY (or the recorded one).
+Latencies are seeded per request, so a replay is the same whatever order threads make their calls in.
+
+Enabled with utils.initialize_clients(fixtures_mode="record" | "replay", fixtures_dir=...), e.g. via
+batch_runner.py --record-fixtures/--replay-fixtures; see benchmarks/end_to_end.py.
+"""
+import os
+import re
+import json
+import time
+import math
+import random
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from model_config import REPLAY_LATENCY, REPLAY_LATENCY_SCALE, REPLAY_SEED, REPLAY_STRICT
+from context_builder import estimate_tokens
+
+FIXTURE_KINDS = ("search", "extract", "completion")
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+class FixtureMissing(KeyError):
+    """Raised in strict replay mode for a request that wasn't recorded."""
+
+def _count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+def get_replay_stats() -> Dict[str, int]:
+    """Fixtures recorded, served (hits) and substituted for unrecorded requests (misses) by kind, in this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+def request_key(request) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def search_request(params: Dict) -> Dict:
+    return {key: value for key, value in params.items() if key != "timeout"}
+
+def completion_request(params: Dict) -> Dict:
+    # sampling settings are left out, so fixtures survive tuning them; a different prompt or model is a different request
+    return {"model": params["model"], "messages": params["messages"], "max_tokens": params.get("max_tokens")}
+
+class FixtureStore:
+    """
+    Fixture files in directory/<kind>/<request key>.json.
+
+    Args:
+        directory (str): The fixture directory.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._keys: Dict[str, List[str]] = {}
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, f"{key}.json")
+
+    def save(self, kind: str, key: str, fixture: Dict):
+        os.makedirs(os.path.join(self.directory, kind), exist_ok=True)
+        # written to a temporary file and renamed, so concurrent recorders and readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, kind), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, self._path(kind, key))
+        _count(f"{kind}_recorded")
+
+    def load(self, kind: str, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(kind, key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def keys(self, kind: str) -> List[str]:
+        if kind not in self._keys:
+            directory = os.path.join(self.directory, kind)
+            names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+            self._keys[kind] = [name[:-len(".json")] for name in names if name.endswith(".json")]
+        return self._keys[kind]
+
+    def get(self, kind: str, key: str, strict: bool = REPLAY_STRICT) -> Tuple[Dict, bool]:
+        """
+        Load a fixture. An unrecorded request (e.g. a prompt changed since recording) gets a recorded fixture of the
+        same kind, picked by its key so replays stay deterministic, unless strict.
+
+        Returns:
+            Tuple[Dict, bool]: The fixture and whether it was recorded for this request.
+        """
+        fixture = self.load(kind, key)
+        if fixture is not None:
+            _count(f"{kind}_hits")
+            return fixture, True
+        _count(f"{kind}_misses")
+        keys = self.keys(kind)
+        if strict or not keys:
+            raise FixtureMissing(f"No {kind} fixture for request {key} in {self.directory}")
+        return self.load(kind, keys[int(key, 16) % len(keys)]), False
+
+class LatencyModel:
+    """
+    Provider latencies for replay, per stage ("search", "extract", "llm_first_token", "llm_token").
+
+    Each stage is configured as {"median": s, "p95": s} (a lognormal distribution), {"fixed": s} or {"recorded": True}
+    (the latency measured when recording), and all latencies are multiplied by scale.
+
+    Args:
+        config (Dict, optional): Per stage settings. Defaults to REPLAY_LATENCY.
+        scale (float, optional): Factor for all latencies, e.g. 0 to measure only local work. Defaults to REPLAY_LATENCY_SCALE.
+        seed (int, optional): Seed of the latency draws. Defaults to REPLAY_SEED.
+    """
+    def __init__(self, config: Optional[Dict] = None, scale: float = REPLAY_LATENCY_SCALE, seed: int = REPLAY_SEED):
+        self.config = config or REPLAY_LATENCY
+        self.scale = scale
+        self.seed = seed
+        self._draws = Counter()
+        self._lock = threading.Lock()
+
+    def sample(self, stage: str, key: str, recorded: Optional[float] = None) -> float:
+        """
+        Draw a latency for a request; the n-th draw for the same stage and request is always the same.
+
+        Args:
+            stage (str): The stage, see above.
+            key (str): The request key.
+            recorded (float, optional): The recorded latency, for stages set to {"recorded": True}. Defaults to None.
+
+        Returns:
+            float: Seconds.
+        """
+        settings = self.config.get(stage, {})
+        if settings.get("recorded") and recorded is not None:
+            return recorded * self.scale
+        if "fixed" in settings:
+            return settings["fixed"] * self.scale
+        if "median" not in settings:
+            return 0.0
+        with self._lock:
+            draw = self._draws[(stage, key)]
+            self._draws[(stage, key)] += 1
+        rng = random.Random(f"{self.seed}:{stage}:{key}:{draw}")
+        sigma = math.log(settings["p95"] / settings["median"]) / 1.645 if settings.get("p95", 0) > settings["median"] else 0.0
+        return rng.lognormvariate(math.log(settings["median"]), sigma) * self.scale
+
+def _split_stream(text: str) -> List[str]:
+    # word-sized pieces that add up to exactly the text
+    return re.findall(r"\S+\s*|\s+", text)
+
+def _usage(fixture: Dict, prompt: str, exact: bool) -> Dict:
+    # recorded usage for recorded requests; otherwise the prompt is counted, so prompt-size changes show in benchmarks
+    usage = fixture.get("usage") or {}
+    completion_tokens = usage.get("completion_tokens") or estimate_tokens(fixture["content"])
+    prompt_tokens = usage.get("prompt_tokens") if exact and usage.get("prompt_tokens") else estimate_tokens(prompt)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+class ReplayTavilyClient:
+    """Serves recorded Tavily searches and page extracts."""
+    def __init__(self, store: FixtureStore, latency: LatencyModel):
+        self.store = store
+        self.latency = latency
+
+    def search(self, **kwargs) -> Dict:
+        key = request_key(search_request(kwargs))
+        fixture, _ = self.store.get("search", key)
+        time.sleep(self.latency.sample("search", key, fixture.get("latency")))
+        return json.loads(json.dumps(fixture["response"]))  # callers modify results in place
+
+    def extract(self, urls: List[str], **kwargs) -> Dict:
+        response = {"results": [], "failed_results": []}
+        latencies = []
+        for url in urls:
+            fixture = self.store.load("extract", request_key(url))
+            if fixture is None:
+                _count("extract_misses")
+                response["failed_results"].append({"url": url, "error": "not recorded"})
+                continue
+            _count("extract_hits")
+            latencies.append(fixture.get("latency") or 0.0)
+            if fixture.get("raw_content") is not None:
+                response["results"].append({"url": url, "raw_content": fixture["raw_content"]})
+            else:
+                response["failed_results"].append({"url": url, "error": fixture.get("error")})
+        time.sleep(self.latency.sample("extract", request_key(sorted(urls)), max(latencies, default=None)))
+        return response
+
+class ReplayLiteLLM:
+    """Serves recorded completions as litellm responses, streamed piece by piece if requested."""
+    def __init__(self, store: FixtureStore, latency: LatencyModel):
+        self.store = store
+        self.latency = latency
+
+    def _lookup(self, params: Dict):
+        key = request_key(completion_request(params))
+        fixture, exact = self.store.get("completion", key)
+        usage = _usage(fixture, params["messages"][0]["content"], exact)
+        return key, fixture, usage
+
+    def completion(self, **params):
+        import litellm
+
+        key, fixture, usage = self._lookup(params)
+        first_token = self.latency.sample("llm_first_token", key, fixture.get("first_token_latency"))
+        if params.get("stream"):
+            return self._stream(params["model"], key, fixture, usage, first_token)
+        per_token = self.latency.sample("llm_token", key)
+        time.sleep(first_token + per_token * usage["completion_tokens"])
+        return litellm.ModelResponse(model=params["model"], usage=usage,
+                                     choices=[{"message": {"role": "assistant", "content": fixture["content"]}, "finish_reason": "stop"}])
+
+    def _stream(self, model: str, key: str, fixture: Dict, usage: Dict, first_token: float):
+        from litellm.types.utils import ModelResponseStream, StreamingChoices, Delta, Usage
+
+        time.sleep(first_token)
+        for i, piece in enumerate(_split_stream(fixture["content"])):
+            if i:
+                time.sleep(self.latency.sample("llm_token", key) * estimate_tokens(piece))
+            yield ModelResponseStream(model=model, choices=[StreamingChoices(index=0, delta=Delta(content=piece, role="assistant"))])
+        yield ModelResponseStream(model=model, choices=[StreamingChoices(index=0, delta=Delta(content=None), finish_reason="stop")],
+                                  usage=Usage(**usage))
+
+class ReplayInstructorClient:
+    """
+    Serves recorded completions through the instructor client interface (chat.completions.create). Only plain
+    completions: structured (response_model) ones aren't recorded, see RecordingInstructorClient.
+    """
+    def __init__(self, replay_litellm: ReplayLiteLLM):
+        self.chat = self
+        self.completions = self
+        self._litellm = replay_litellm
+
+    def create(self, response_model=None, **params):
+        if response_model is not None:
+            raise ValueError(f"Cannot replay a structured completion (response_model "
+                             f"{getattr(response_model, '__name__', repr(response_model))}): only plain completions are recorded")
+        return self._litellm.completion(**params)
+
+class RecordingTavilyClient:
+    """Wraps a Tavily client and records its searches and extracts."""
+    def __init__(self, client, store: FixtureStore):
+        self.client = client
+        self.store = store
+
+    def search(self, **kwargs) -> Dict:
+        start_time = time.monotonic()
+        response = self.client.search(**kwargs)
+        request = search_request(kwargs)
+        self.store.save("search", request_key(request), {"request": request, "response": response,
+                                                         "latency": round(time.monotonic() - start_time, 3)})
+        return response
+
+    def extract(self, urls: List[str], **kwargs) -> Dict:
+        start_time = time.monotonic()
+        response = self.client.extract(urls=urls, **kwargs)
+        latency = round(time.monotonic() - start_time, 3)
+        for result in response.get("results", []):
+            self.store.save("extract", request_key(result["url"]), {"url": result["url"], "raw_content": result.get("raw_content"), "latency": latency})
+        for failed in response.get("failed_results", []):
+            self.store.save("extract", request_key(failed.get("url")), {"url": failed.get("url"), "error": failed.get("error"), "latency": latency})
+        return response
+
+def _save_completion(store: FixtureStore, params: Dict, content: str, usage, latency: float, first_token_latency: Optional[float] = None):
+    request = completion_request(params)
+    store.save("completion", request_key(request), {
+        "request": request, "content": content, "latency": round(latency, 3),
+        "first_token_latency": round(first_token_latency, 3) if first_token_latency is not None else None,
+        "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                  "total_tokens": usage.total_tokens} if usage is not None else None})
+
+class RecordingLiteLLM:
+    """Wraps litellm and records streamed completions once they are complete."""
+    def __init__(self, client, store: FixtureStore):
+        self.client = client
+        self.store = store
+
+    def completion(self, **params):
+        if not params.get("stream"):
+            start_time = time.monotonic()
+            resp = self.client.completion(**params)
+            _save_completion(self.store, params, resp["choices"][0]["message"]["content"], resp.usage, time.monotonic() - start_time)
+            return resp
+        return self._record_stream(params)
+
+    def _record_stream(self, params: Dict):
+        start_time = time.monotonic()
+        first_token_latency = None
+        chunks = []
+        for chunk in self.client.completion(**params):
+            if first_token_latency is None:
+                first_token_latency = time.monotonic() - start_time
+            chunks.append(chunk)
+            yield chunk
+        latency = time.monotonic() - start_time
+        try:
+            resp = self.client.stream_chunk_builder(chunks, messages=params["messages"])
+            _save_completion(self.store, params, resp["choices"][0]["message"]["content"], resp.usage, latency, first_token_latency)
+        except Exception as e:
+            logging.error(f"Error recording streamed completion: {str(e)}")
+
+class RecordingInstructorClient:
+    """Wraps the instructor client and records plain (non-structured) completions."""
+    def __init__(self, client, store: FixtureStore):
+        self.chat = self
+        self.completions = self
+        self.client = client
+        self.store = store
+
+    def create(self, response_model=None, **params):
+        start_time = time.monotonic()
+        resp = self.client.chat.completions.create(response_model=response_model, **params)
+        if response_model is None:
+            _save_completion(self.store, params, resp["choices"][0]["message"]["content"], resp.usage, time.monotonic() - start_time)
+        return resp
+
+def replay_clients(directory: str):
+    """
+    Create the replay clients for a fixture directory.
+
+    Args:
+        directory (str): The fixture directory.
+
+    Returns:
+        Tuple: The litellm, Tavily and instructor client replacements.
+    """
+    store = FixtureStore(directory)
+    if not any(store.keys(kind) for kind in FIXTURE_KINDS):
+        logging.warning(f"No fixtures in {directory}; record some with batch_runner.py --record-fixtures {directory}")
+    replay_litellm = ReplayLiteLLM(store, LatencyModel())
+    return replay_litellm, ReplayTavilyClient(store, replay_litellm.latency), ReplayInstructorClient(replay_litellm)
+
+def recording_clients(directory: str, litellm_client, tavily_client, instructor_client):
+    """
+    Wrap the real clients so their responses are recorded to a fixture directory.
+
+    Args:
+        directory (str): The fixture directory.
+        litellm_client: The litellm module.
+        tavily_client: The Tavily client.
+        instructor_client: The instructor client.
+
+    Returns:
+        Tuple: The wrapped litellm, Tavily and instructor clients.
+    """
+    store = FixtureStore(directory)
+    return (RecordingLiteLLM(litellm_client, store), RecordingTavilyClient(tavily_client, store) if tavily_client else None,
+            RecordingInstructorClient(instructor_client, store))
@@ -0,0 +1,258 @@
+"""
+Persistent job queue (SQLite) shared by the Streamlit UI and worker processes.
+
+The UI creates a run per analysed company and submits step, summary and draft email jobs to it; worker.py processes
+claim and run them and write partial (streamed) and final results back. Everything lives in JOB_DB_PATH rather than in
+a Streamlit session, so a browser refresh, session timeout or app restart loses nothing, and a worker that dies is
+detected by its missing heartbeat and its jobs are requeued (their completed searches and completions are cache hits).
+
+A summary job starts only after the run's step jobs submitted before it have finished, a draft email job only after
+the steps and summary before it, so "Analyze Company" can submit the whole pipeline at once.
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from model_config import JOB_DB_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+JOB_KINDS = ("step", "summary", "draft_email")  # in pipeline order; a job waits for earlier kinds submitted before it
+PENDING = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    company_url TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    kind TEXT NOT NULL,
+    step_index INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed, skipped
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    result TEXT NOT NULL DEFAULT '',
+    partial TEXT NOT NULL DEFAULT '',
+    condensed TEXT NOT NULL DEFAULT '',
+    error TEXT,
+    trace TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id, job_id);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id);
+"""
+
+_KIND_ORDER_SQL = "CASE {table}.kind WHEN 'step' THEN 0 WHEN 'summary' THEN 1 ELSE 2 END"
+
+_local = threading.local()
+
+def _db() -> sqlite3.Connection:
+    # one connection per thread; autocommit, with explicit transactions where several statements must be atomic
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")  # the UI reads while workers write
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def _transaction():
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def slot(job: Dict) -> str:
+    """The panel a job's result belongs to: "step_<index>", "summary" or "draft_email"."""
+    return f"step_{job['step_index']}" if job["kind"] == "step" else job["kind"]
+
+def create_run(company_url: str) -> str:
+    """
+    Create a run for a company; its jobs and results are looked up by the returned run ID.
+
+    Args:
+        company_url (str): The company, as its company ID (see company_identity.canonical_company_id).
+
+    Returns:
+        str: The run ID.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    _db().execute("INSERT INTO runs (run_id, company_url, created_at) VALUES (?, ?, ?)", (run_id, company_url, time.time()))
+    return run_id
+
+def get_run(run_id: str) -> Optional[Dict]:
+    row = _db().execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+def submit_job(run_id: str, kind: str, step_index: Optional[int] = None) -> int:
+    """
+    Queue a job for a run.
+
+    Args:
+        run_id (str): The run, see create_run.
+        kind (str): "step", "summary" or "draft_email".
+        step_index (int, optional): The index in WORKFLOW_STEPS, for step jobs. Defaults to None.
+
+    Returns:
+        int: The job ID.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    cursor = _db().execute("INSERT INTO jobs (run_id, kind, step_index, created_at) VALUES (?, ?, ?, ?)",
+                           (run_id, kind, step_index, time.time()))
+    return cursor.lastrowid
+
+def submit_analysis(run_id: str, step_count: int) -> List[int]:
+    """Queue all steps, then the summary and the draft email (which wait for the steps), in one transaction."""
+    with _transaction():
+        job_ids = [submit_job(run_id, "step", i) for i in range(step_count)]
+        job_ids.append(submit_job(run_id, "summary"))
+        job_ids.append(submit_job(run_id, "draft_email"))
+    return job_ids
+
+def claim_job(worker: str) -> Optional[Dict]:
+    """
+    Take the oldest queued job whose run has no unfinished earlier-stage job submitted before it.
+
+    Args:
+        worker (str): The claiming worker's ID; only it can update the job from now on.
+
+    Returns:
+        Optional[Dict]: The job (with its run's company_url), or None if nothing can start.
+    """
+    with _transaction() as conn:
+        row = conn.execute(f"""
+            SELECT j.*, r.company_url FROM jobs j JOIN runs r ON r.run_id = j.run_id
+            WHERE j.status = 'queued' AND NOT EXISTS (
+                SELECT 1 FROM jobs d WHERE d.run_id = j.run_id AND d.job_id < j.job_id AND d.status IN ('queued', 'running')
+                AND {_KIND_ORDER_SQL.format(table='d')} < {_KIND_ORDER_SQL.format(table='j')})
+            ORDER BY j.job_id LIMIT 1""").fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        conn.execute("UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, partial = '', "
+                     "started_at = ?, heartbeat_at = ? WHERE job_id = ?", (worker, now, now, row["job_id"]))
+    return {**dict(row), "status": "running", "worker": worker, "attempts": row["attempts"] + 1, "started_at": now}
+
+def heartbeat(worker: str):
+    """Renew the lease on all jobs a worker is running."""
+    _db().execute("UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND status = 'running'", (time.time(), worker))
+
+def update_partial(job_id: int, worker: str, partial: str):
+    """Store a running job's streamed output so far."""
+    _db().execute("UPDATE jobs SET partial = ?, heartbeat_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                  (partial, time.time(), job_id, worker))
+
+def finish_job(job_id: int, worker: str, status: str, result: str = "", condensed: str = "",
+               error: Optional[str] = None, trace: Optional[List[Dict]] = None) -> bool:
+    """
+    Store a job's outcome; ignored if the job was requeued to another worker in the meantime.
+
+    Args:
+        job_id (int): The job.
+        worker (str): The worker that ran it.
+        status (str): "done", "failed" or "skipped" (nothing to do, e.g. a summary without step results).
+        result (str, optional): The result text, or the error message shown in its panel. Defaults to "".
+        condensed (str, optional): The condensed step result, see cached_condense_step. Defaults to "".
+        error (str, optional): The exception, for the log. Defaults to None.
+        trace (List[Dict], optional): The job's spans, see Trace.to_list. Defaults to None.
+
+    Returns:
+        bool: Whether the outcome was stored.
+    """
+    cursor = _db().execute("UPDATE jobs SET status = ?, result = ?, condensed = ?, error = ?, trace = ?, partial = '', "
+                           "finished_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                           (status, result, condensed, error, json.dumps(trace) if trace is not None else None,
+                            time.time(), job_id, worker))
+    return cursor.rowcount == 1
+
+def requeue_stale_jobs() -> int:
+    """
+    Requeue running jobs whose worker stopped sending heartbeats (crashed or was killed); jobs that already used
+    JOB_MAX_ATTEMPTS are marked failed instead.
+
+    Returns:
+        int: The number of jobs requeued or failed.
+    """
+    stale_before = time.time() - JOB_LEASE_SECONDS
+    with _transaction() as conn:
+        failed = conn.execute("UPDATE jobs SET status = 'failed', error = 'worker lost', finished_at = ? "
+                              "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                              (time.time(), stale_before, JOB_MAX_ATTEMPTS)).rowcount
+        requeued = conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, partial = '' "
+                                "WHERE status = 'running' AND heartbeat_at < ?", (stale_before,)).rowcount
+    return failed + requeued
+
+def get_latest_jobs(run_id: Optional[str]) -> Dict[str, Dict]:
+    """
+    Get the latest job per panel of a run (skipped jobs don't replace earlier results).
+
+    Args:
+        run_id (str): The run, or None.
+
+    Returns:
+        Dict[str, Dict]: The jobs by slot ("step_<index>", "summary", "draft_email"), without their traces.
+    """
+    if run_id is None:
+        return {}
+    rows = _db().execute("SELECT job_id, run_id, kind, step_index, status, result, partial, condensed, created_at, "
+                         "started_at, finished_at FROM jobs WHERE run_id = ? AND status != 'skipped' ORDER BY job_id",
+                         (run_id,)).fetchall()
+    return {slot(row): dict(row) for row in rows}
+
+def get_step_results(run_id: str, step_count: int, condensed: bool = False) -> List[str]:
+    """
+    Get the latest successful result of each step of a run, e.g. as input for its summary.
+
+    Args:
+        run_id (str): The run.
+        step_count (int): The number of workflow steps.
+        condensed (bool, optional): Prefer the condensed result where there is one. Defaults to False.
+
+    Returns:
+        List[str]: The results by step index; "" where a step has no successful result.
+    """
+    results = [""] * step_count
+    for row in _db().execute("SELECT step_index, result, condensed FROM jobs WHERE run_id = ? AND kind = 'step' "
+                             "AND status = 'done' ORDER BY job_id", (run_id,)):
+        if row["step_index"] < step_count:
+            results[row["step_index"]] = (condensed and row["condensed"]) or row["result"]
+    return results
+
+def get_latest_result(run_id: str, kind: str) -> str:
+    """Get the latest successful result of a run's summary or draft email jobs ("" if there is none)."""
+    row = _db().execute("SELECT result FROM jobs WHERE run_id = ? AND kind = ? AND status = 'done' ORDER BY job_id DESC LIMIT 1",
+                        (run_id, kind)).fetchone()
+    return row["result"] if row is not None else ""
+
+def get_run_spans(run_id: str) -> List[Dict]:
+    """Get the spans recorded by all finished jobs of a run, see tracing.summarize_spans."""
+    spans = []
+    for row in _db().execute("SELECT trace FROM jobs WHERE run_id = ? AND trace IS NOT NULL ORDER BY job_id", (run_id,)):
+        spans.extend(json.loads(row["trace"]))
+    return spans
+
+def get_queue_stats() -> Dict:
+    """
+    Get the number of jobs per status and the age of the oldest queued job.
+
+    Returns:
+        Dict: Counts per status, oldest_queued_seconds and the database path.
+    """
+    conn = _db()
+    stats = {row["status"]: row["count"] for row in conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")}
+    oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    return {**stats, "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest is not None else None, "database": JOB_DB_PATH}
@@ -0,0 +1,143 @@
+"""
+Non-blocking, size-capped logging.
+
+Callers only put records on a queue; a QueueListener thread formats them and writes JSON lines to a size-rotated
+log file plus plain text to the console, truncating long messages. Full payloads (LLM parameters and responses,
+raw search results) go to audit_log instead, which writes to a separate, optional and sampled audit file.
+"""
+import json
+import queue
+import random
+import atexit
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+from model_config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_MAX_MESSAGE_CHARS, AUDIT_LOG_FILE, AUDIT_SAMPLE_RATE
+from tracing import get_current_trace
+
+AUDIT_LOGGER_NAME = "audit"
+
+audit_logger = logging.getLogger(AUDIT_LOGGER_NAME)
+audit_logger.propagate = False  # never ends up in the main log, with or without an audit sink
+
+_listener: Optional[QueueListener] = None
+
+def truncate(text: str, max_chars: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [truncated {len(text) - max_chars} chars]"
+
+def audit_log(event: str, payload: Any):
+    """
+    Write a full payload to the audit sink, if one is configured (AUDIT_LOG_FILE) and the record is sampled
+    (AUDIT_SAMPLE_RATE). The payload is only serialized on the logging thread.
+
+    Args:
+        event (str): What the payload is, e.g. "llm_request" or "search_results".
+        payload (Any): The payload; anything json.dumps can handle, falling back to str().
+    """
+    if not audit_logger.handlers or random.random() >= AUDIT_SAMPLE_RATE:
+        return
+    audit_logger.info(event, extra={"payload": payload})
+
+def _to_json(value: Any) -> Any:
+    # pydantic models (litellm responses, instructor outputs) as dicts, anything else as its string
+    model_dump = getattr(value, "model_dump", None)
+    if callable(model_dump):
+        try:
+            return model_dump()
+        except Exception:
+            pass
+    return str(value)
+
+class _TraceIdFilter(logging.Filter):
+    # runs in the calling thread, where the run's trace is current, before the record is queued
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = get_current_trace()
+        record.trace_id = trace.trace_id if trace is not None else None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; messages are truncated, payloads (audit records) are kept in full."""
+    def __init__(self, max_message_chars: Optional[int] = LOG_MAX_MESSAGE_CHARS):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "trace_id": getattr(record, "trace_id", None),
+            "message": truncate(message, self.max_message_chars) if self.max_message_chars else message,
+        }
+        if hasattr(record, "payload"):
+            entry["payload"] = record.payload
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=_to_json, ensure_ascii=False)
+
+class TruncatingFormatter(logging.Formatter):
+    """The plain console format, with long messages truncated."""
+    def format(self, record: logging.LogRecord) -> str:
+        return truncate(super().format(record))
+
+def _only(logger_name: str, keep: bool) -> logging.Filter:
+    class LoggerFilter(logging.Filter):
+        def filter(self, record: logging.LogRecord) -> bool:
+            return (record.name == logger_name) == keep
+    return LoggerFilter()
+
+def start_logging(level: int = logging.INFO):
+    """
+    Route the root and audit loggers through a queue to a background listener; no-op if already started
+    (Streamlit re-runs the setup on every interaction).
+
+    Args:
+        level (int, optional): The level of the root logger. Defaults to logging.INFO.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(TruncatingFormatter('%(asctime)s - %(message)s'))
+    handlers = [file_handler, stream_handler]
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.addFilter(_only(AUDIT_LOGGER_NAME, keep=False))
+
+    log_queue = queue.SimpleQueue()
+    root_queue_handler = QueueHandler(log_queue)
+    root_queue_handler.addFilter(_TraceIdFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(root_queue_handler)
+    root.setLevel(level)
+
+    if AUDIT_LOG_FILE:
+        audit_handler = RotatingFileHandler(AUDIT_LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        audit_handler.setFormatter(JsonFormatter(max_message_chars=None))
+        audit_handler.addFilter(_only(AUDIT_LOGGER_NAME, keep=True))
+        handlers.append(audit_handler)
+        audit_queue_handler = QueueHandler(log_queue)
+        audit_queue_handler.addFilter(_TraceIdFilter())
+        audit_logger.addHandler(audit_queue_handler)
+        audit_logger.setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,3 +1,5 @@
+import os
+
 # Initialize REQUIRED_ENV
 REQUIRED_ENV = ["TAVILY_API_KEY"]
 
@@ -6,6 +8,7 @@ MODEL = "sonnet_vertex"
 
 if MODEL == "sonnet_vertex":
     MODEL_NAME = "vertex_ai/claude-3-5-sonnet@20240620"
+    FAST_MODEL_NAME = "vertex_ai/claude-3-haiku@20240307"  # cheap, low-latency model for bulk extraction
     TEMPERATURE = 0.5  # 0.3-0.5 for balanced, more for creativity
     TOP_P = None  # don't adjust both temp and top_p
     FREQUENCY_PENALTY = None  # n/a on vertex
@@ -13,10 +16,12 @@ if MODEL == "sonnet_vertex":
     REQUIRED_ENV.extend(["GOOGLE_APPLICATION_CREDENTIALS", "VERTEXAI_PROJECT", "VERTEXAI_LOCATION"])
 elif MODEL == "gpt4o_openai":
     MODEL_NAME = "gpt-4o"
+    FAST_MODEL_NAME = "gpt-4o-mini"
     TEMPERATURE = 0.4  # 0.3-0.5 for balanced, more for creativity
     REQUIRED_ENV.append("OPENAI_API_KEY")
 elif MODEL == "deepseek":
     MODEL_NAME = "deepseek/deepseek-chat"
+    FAST_MODEL_NAME = "deepseek/deepseek-chat"
     TEMPERATURE = None
     TOP_P = None
     FREQUENCY_PENALTY = None
@@ -24,3 +29,119 @@ elif MODEL == "deepseek":
     REQUIRED_ENV.append("DEEPSEEK_API_KEY")
 else:
     raise ValueError("Invalid MODEL_CHOICE.")
+
+# Rate limits per provider ("tavily", or the LLM provider prefix such as "vertex_ai") and per model name;
+# rpm = requests/min, tpm = tokens/min (prompt + max. completion, corrected by actual usage), max_concurrency = calls in flight
+RATE_LIMITS = {
+    "tavily": {"rpm": 100, "max_concurrency": 10},
+    FAST_MODEL_NAME: {"rpm": 200, "tpm": 200000, "max_concurrency": 16},
+    MODEL_NAME: {"rpm": 50, "tpm": 80000, "max_concurrency": 8},
+}
+
+# Timeouts, retries (transient errors only, exponential backoff with jitter) and hedged LLM requests
+LLM_TIMEOUT = 120  # seconds per completion attempt
+SEARCH_TIMEOUT = 30  # seconds per search attempt
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0  # seconds; doubles per retry
+RETRY_MAX_DELAY = 30.0  # seconds
+HEDGE_REQUESTS = False  # also send slow requests to FALLBACK_MODEL_NAME and use whichever answers first
+FALLBACK_MODEL_NAME = "gpt-4o"  # needs its provider's credentials when hedging is enabled
+HEDGE_DEFAULT_DELAY = 45.0  # seconds before hedging until enough latencies are known for a p95
+HEDGE_MIN_SAMPLES = 20  # completions per model needed before their p95 latency is used as hedge delay
+
+# Stream LLM responses into the UI as they arrive (final text is still cached as a whole)
+STREAM_RESPONSES = True
+
+# Condense each step's result as soon as it finishes, so the final summary only reduces short notes
+INCREMENTAL_SUMMARY = True
+CONDENSE_MAX_TOKENS = 400
+
+# Model per pipeline stage, with its own sampling settings and fallback models tried in order (after retries) when it
+# fails; steps can override "model", "temperature", "max_tokens" and "fallbacks" of the step stage in WORKFLOW_STEPS.
+# Completions are cached per model, so changing a stage's model doesn't reuse another model's answers.
+MODEL_ROUTES = {
+    "step": {"model": FAST_MODEL_NAME, "temperature": TEMPERATURE, "max_tokens": 1024, "fallbacks": [MODEL_NAME]},
+    "condense": {"model": FAST_MODEL_NAME, "temperature": TEMPERATURE, "max_tokens": CONDENSE_MAX_TOKENS, "fallbacks": [MODEL_NAME]},
+    "summary": {"model": MODEL_NAME, "temperature": TEMPERATURE, "max_tokens": 1024, "fallbacks": [FAST_MODEL_NAME]},  # a cheaper answer beats none
+    "draft_email": {"model": MODEL_NAME, "temperature": TEMPERATURE, "max_tokens": 1024, "fallbacks": [FAST_MODEL_NAME]},
+    "classify_industry": {"model": FAST_MODEL_NAME, "temperature": 0, "max_tokens": 20, "fallbacks": [MODEL_NAME]},
+}
+
+# Sector-level research ("scope": "industry" steps in WORKFLOW_STEPS) is shared by all companies of an industry
+INDUSTRY_TTL = 4 * 7 * 24 * 60 * 60  # seconds to keep a sector's result, unless the step sets "sector_ttl"
+COMPANY_INDUSTRIES = {}  # company ID -> industry, skips classification, e.g. for a campaign on one vertical
+
+# Prompt context settings; override per step via "context_token_budget" and "top_k_passages" in WORKFLOW_STEPS
+CONTEXT_TOKEN_BUDGET = 6000  # max. tokens of search result text sent with each step's prompt
+PASSAGE_TOP_K = 15  # max. passages (of up to ~300 tokens each) ranked most relevant to the step's question
+
+# Cache settings; per-step expiry is set via "cache_ttl" in WORKFLOW_STEPS
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/mycache")
+CACHE_SIZE_LIMIT = int(os.environ.get("CACHE_SIZE_LIMIT", 1024 ** 3))  # bytes in CACHE_DIR, split between results and the document store
+DOCUMENT_STORE_SIZE_LIMIT = int(os.environ.get("DOCUMENT_STORE_SIZE_LIMIT", CACHE_SIZE_LIMIT // 2))  # bytes of it for page content
+RESULT_CACHE_SIZE_LIMIT = CACHE_SIZE_LIMIT - DOCUMENT_STORE_SIZE_LIMIT  # bytes of it for searches and completions; evicts beyond
+CACHE_EVICTION_POLICY = "least-recently-used"  # or least-recently-stored, least-frequently-used, none
+SEARCH_CACHE_TTL = 7 * 24 * 60 * 60  # seconds to keep raw search results; independent of prompts and model, capped by step's cache_ttl
+LLM_CACHE_TTL = 30 * 24 * 60 * 60  # seconds to keep completions not tied to a step (summary, draft email)
+SINGLE_FLIGHT_TIMEOUT = 300  # seconds to wait for an identical in-flight call (in another process) before computing anyway
+SINGLE_FLIGHT_POLL_INTERVAL = 0.5  # seconds between checks for the result of an identical call in another process
+CACHE_COMPRESSION_LEVEL = 6  # zstd/zlib level for cached values, see cache_disk.py
+
+# Tracing: per-stage latency, token and cost metrics in Prometheus text format
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None  # serve http://127.0.0.1:<port>/metrics
+METRICS_FILE = os.environ.get("METRICS_FILE")  # or write them to this file (batch mode, at the end of the run)
+
+# Logging: JSON lines written by a background thread, size-rotated; full payloads only go to the optional audit log
+LOG_FILE = "llm_qa.log"
+LOG_MAX_BYTES = 10 * 1024 ** 2  # rotate log files at this size
+LOG_BACKUP_COUNT = 5  # rotated files kept per log
+LOG_MAX_MESSAGE_CHARS = 2000  # longer messages are truncated in the main log and console
+AUDIT_LOG_FILE = os.environ.get("AUDIT_LOG_FILE")  # full LLM requests/responses and search results; disabled if unset
+AUDIT_SAMPLE_RATE = float(os.environ.get("AUDIT_SAMPLE_RATE", 1.0))  # fraction of payloads written to the audit log
+
+# Document store: raw page content fetched once per page and shared by all steps and runs, see document_store.py
+DOCUMENT_STORE_DIR = os.path.join(CACHE_DIR, "documents")
+DOCUMENT_TTL = 7 * 24 * 60 * 60  # seconds before a page is fetched again; capped by the step's cache_ttl
+EXTRACT_BATCH_SIZE = 20  # max. URLs per Tavily extract call
+
+# Search result filter, applied before any page content is fetched; steps can add "exclude_domains" in WORKFLOW_STEPS
+EXCLUDED_FILE_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf', '.csv', '.zip', '.rar')
+BLOCKED_DOMAINS = ("youtube.com", "instagram.com", "facebook.com", "tiktok.com", "pinterest.com")  # little extractable text; also subdomains
+
+# Company identity: company URLs are reduced to one company ID (host without www), see company_identity.py
+COMPANY_ALIASES = {}  # alias -> company ID, e.g. {"acme.de": "acme.com"}
+COMPANY_ALIASES_FILE = os.environ.get("COMPANY_ALIASES_FILE")  # JSON object with more aliases, e.g. shared by the team
+RESOLVE_COMPANY_REDIRECTS = os.environ.get("RESOLVE_COMPANY_REDIRECTS", "").lower() in ("1", "true")  # one request per company and process
+COMPANY_REDIRECT_TIMEOUT = 5  # seconds
+
+# Speculative prefetch: the UI starts a company's searches as soon as its URL is entered, see prefetch.py
+PREFETCH_ON_INPUT = True
+PREFETCH_PAGES = False  # also fetch the pages found (Tavily extract credits are spent even if the analysis isn't started)
+PREFETCH_CONCURRENCY = 4  # searches in flight per UI process
+
+# Cache warming (warm_cache.py): refreshes the results of a watchlist of companies once per day in off-peak hours
+WATCHLIST_FILE = os.environ.get("WATCHLIST_FILE", "watchlist.txt")  # one company URL per line
+WARM_CACHE_HOURS = (2, 6)  # local hours [start, end) to warm in; may wrap around midnight, e.g. (22, 4)
+WARM_CACHE_REFRESH_WINDOW = 24 * 60 * 60  # entries expiring within this (until the next warming) are recomputed
+WARM_CACHE_CHECK_INTERVAL = 60  # seconds between checks whether it's time to warm
+
+# Job queue: the UI submits step, summary and draft email jobs, worker.py processes run them, see job_queue.py
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.sqlite3")  # shared by the UI and all workers
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 8))  # jobs run at the same time per worker process
+JOB_POLL_INTERVAL = 0.5  # seconds between checks for new jobs (workers) and job changes (UI)
+JOB_LEASE_SECONDS = 60  # a running job whose worker sent no heartbeat for this long is requeued
+JOB_MAX_ATTEMPTS = 3  # tries per job (worker crashes/restarts) before it is marked failed
+JOB_PARTIAL_INTERVAL = 0.5  # min. seconds between writes of a streaming job's partial result
+
+# Record/replay of provider responses (fixtures.py): replayed latencies per stage as {"median", "p95"} seconds
+# (lognormal), {"fixed": s} or {"recorded": True}; llm_token is seconds per streamed output token
+FIXTURES_DIR = os.environ.get("FIXTURES_DIR", "fixtures")
+REPLAY_LATENCY = {
+    "search": {"median": 1.5, "p95": 4.0},
+    "extract": {"median": 2.5, "p95": 8.0},
+    "llm_first_token": {"median": 1.2, "p95": 4.0},
+    "llm_token": {"median": 0.02, "p95": 0.04},
+}
+REPLAY_LATENCY_SCALE = float(os.environ.get("REPLAY_LATENCY_SCALE", 1.0))  # e.g. 0 to measure local work only
+REPLAY_SEED = int(os.environ.get("REPLAY_SEED", 0))
+REPLAY_STRICT = os.environ.get("REPLAY_STRICT", "").lower() in ("1", "true")  # fail on unrecorded requests instead of substituting
@@ -0,0 +1,67 @@
+"""
+In-process BM25 ranking of passages against a step's question, so only the most relevant parts of each page
+are sent to the model. Pure Python; the corpus is a few dozen passages per step, so no index persistence needed.
+"""
+import math
+import re
+from collections import Counter
+from typing import List
+
+BM25_K1 = 1.5  # term frequency saturation
+BM25_B = 0.75  # document length normalization
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can com for from has have how in include including into is it its of on or our
+such that the their them then there these they this to was were what which who will with within you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS and len(token) > 1]
+
+class BM25:
+    """
+    Okapi BM25 scorer over a fixed list of passages.
+
+    Args:
+        passages (List[str]): The passages to index.
+        k1 (float, optional): Term frequency saturation. Defaults to BM25_K1.
+        b (float, optional): Document length normalization. Defaults to BM25_B.
+    """
+    def __init__(self, passages: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(passage)) for passage in passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequencies = Counter(term for tf in self.term_frequencies for term in tf)
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequencies.items()}
+
+    def scores(self, query: str) -> List[float]:
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for tf, length in zip(self.term_frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            scores.append(sum(self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm) for term in query_terms if term in tf))
+        return scores
+
+def rank_passages(passages: List[str], query: str, top_k: int) -> List[int]:
+    """
+    Rank passages by BM25 relevance to the query.
+
+    Args:
+        passages (List[str]): The candidate passages.
+        query (str): The question the passages should answer.
+        top_k (int): The max. number of passages to return.
+
+    Returns:
+        List[int]: Indices into passages, most relevant first; passages without any query term are dropped
+        unless fewer than top_k passages match.
+    """
+    scores = BM25(passages).scores(query)
+    ranked = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+    matching = [i for i in ranked if scores[i] > 0]
+    if len(matching) < top_k:
+        matching += [i for i in ranked if scores[i] <= 0][:top_k - len(matching)]
+    return matching[:top_k]
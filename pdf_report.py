@@ -0,0 +1,159 @@
+"""
+PDF report of an analysis, rendered with WeasyPrint in a separate process.
+
+Layout is the slowest CPU work in the app, so it never runs on the Streamlit script thread: get_pdf_future submits
+it to a process pool (WeasyPrint is only imported in the worker) and memoizes the result by a hash of the report's
+content, so reruns and other sessions with the same results reuse the same PDF.
+"""
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from tracing import get_current_trace, use_trace, record_span
+
+PDF_CACHE_SIZE = 32  # rendered reports kept in memory
+
+HTML_TEMPLATE = """
+<html>
+<head>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            color: black;
+            font-size: 12px;
+        }}
+        h1, h2 {{
+            color: #00008B;  /* Dark Blue */
+        }}
+        h1 {{
+            font-size: 18px;
+            margin-bottom: 10px;
+        }}
+        h2 {{
+            font-size: 16px;
+            margin-bottom: 5px;
+        }}
+        .section {{
+            margin-bottom: 15px;
+        }}
+    </style>
+</head>
+<body>
+    <h1>Company Analysis Report</h1>
+
+    <div class="section">
+        <h2>Draft Email</h2>
+        <p>{draft_email}</p>
+    </div>
+
+    <div class="section">
+        <h2>Final Summary</h2>
+        <p>{summary}</p>
+    </div>
+
+    {steps}
+</body>
+</html>
+"""
+
+STEP_HTML_TEMPLATE = """
+    <div class="section">
+        <h2>Step {step_number}: {step_name}</h2>
+        <p>{step_result}</p>
+    </div>
+"""
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pdfs: "OrderedDict[str, Future]" = OrderedDict()  # content hash -> future of the PDF bytes, least recently used first
+_lock = threading.Lock()
+
+def build_report_html(step_names: List[str], step_results: List[str], summary: str, draft_email: str) -> str:
+    """
+    Build the report's HTML.
+
+    Args:
+        step_names (List[str]): The names of the workflow steps.
+        step_results (List[str]): The results of the workflow steps.
+        summary (str): The final summary.
+        draft_email (str): The draft email.
+
+    Returns:
+        str: The HTML.
+    """
+    steps_html = [STEP_HTML_TEMPLATE.format(step_number=i + 1, step_name=step_name, step_result=step_result.replace('\n', '<br>'))
+                  for i, (step_name, step_result) in enumerate(zip(step_names, step_results))]
+    return HTML_TEMPLATE.format(
+        draft_email=draft_email.replace('\n', '<br>'),
+        summary=summary.replace('\n', '<br>'),
+        steps=''.join(steps_html)
+    )
+
+def render_pdf(html_content: str) -> bytes:
+    # runs in the worker process, which is the only one that pays for importing WeasyPrint
+    from weasyprint import HTML
+    return HTML(string=html_content).write_pdf()
+
+def report_hash(step_names: List[str], step_results: List[str], summary: str, draft_email: str) -> str:
+    digest = hashlib.sha256()
+    for part in [*step_names, *step_results, summary, draft_email]:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the app process runs many threads, and forking it could copy held locks into the worker
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def get_pdf_future(step_names: List[str], step_results: List[str], summary: str, draft_email: str) -> Future:
+    """
+    Get the PDF report for this content, rendering it in the background if it isn't cached yet.
+
+    Args:
+        step_names (List[str]): The names of the workflow steps.
+        step_results (List[str]): The results of the workflow steps.
+        summary (str): The final summary.
+        draft_email (str): The draft email.
+
+    Returns:
+        Future: Resolves to the PDF as bytes.
+    """
+    key = report_hash(step_names, step_results, summary, draft_email)
+    with _lock:
+        future = _pdfs.get(key)
+        if future is not None and not (future.done() and future.exception() is not None):
+            _pdfs.move_to_end(key)
+            return future
+
+        trace = get_current_trace()
+        submitted = time.perf_counter()
+        html_content = build_report_html(step_names, step_results, summary, draft_email)
+        try:
+            future = _get_executor().submit(render_pdf, html_content)
+        except BrokenProcessPool:  # the worker died (e.g. out of memory); start a fresh one
+            global _executor
+            _executor = None
+            future = _get_executor().submit(render_pdf, html_content)
+        def record(done: Future):
+            with use_trace(trace):
+                record_span("generate_pdf", time.perf_counter() - submitted, failed=done.exception() is not None)
+        future.add_done_callback(record)
+
+        _pdfs[key] = future
+        while len(_pdfs) > PDF_CACHE_SIZE:
+            _pdfs.popitem(last=False)
+    return future
+
+def shutdown():
+    """Stop the rendering process (waiting for renders in progress), e.g. before a script measures its resource usage."""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
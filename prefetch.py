@@ -0,0 +1,69 @@
+"""
+Speculative prefetch: as soon as a company URL is entered in the UI, the searches of its workflow steps (and, with
+PREFETCH_PAGES, the pages they find) run in the background of the UI process. They go through the shared cache and
+document store, so when "Analyze Company" is clicked moments later the workers get cache hits or join the searches
+still in flight (single-flight across processes). Industry-scoped steps are skipped, as their query needs the
+company's industry, which takes an LLM call.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional
+from model_config import PREFETCH_PAGES, PREFETCH_CONCURRENCY, SEARCH_CACHE_TTL, LLM_CACHE_TTL, DOCUMENT_TTL
+from workflow_steps import WORKFLOW_STEPS
+from utils import build_search_params
+from cache_utils import cached_search
+from document_store import get_documents
+from company_identity import canonical_company_id
+from tracing import span
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_CONCURRENCY, thread_name_prefix="prefetch")
+_inflight: Dict[str, Future] = {}  # company ID -> future of its prefetch
+_inflight_lock = threading.Lock()
+
+def _prefetch_step(step: Dict, company_id: str):
+    # same cache TTLs as cache_utils.cached_run_step, so the step finds these entries
+    step_ttl = step.get("cache_ttl", LLM_CACHE_TTL)
+    try:
+        with span("prefetch", step_name=step["step_name"]):
+            search_results = cached_search(build_search_params(step, company_id), cache_ttl=min(SEARCH_CACHE_TTL, step_ttl))
+            if PREFETCH_PAGES:
+                get_documents([result["url"] for result in search_results["results"]], max_age=min(DOCUMENT_TTL, step_ttl))
+    except Exception as e:
+        logging.warning(f"Prefetch of {step['step_name']} for {company_id} failed: {str(e)}")
+
+def prefetch_company(company_url: str) -> Optional[Future]:
+    """
+    Start the searches of a company's workflow steps in the background, unless they're already running.
+
+    Args:
+        company_url (str): The URL as entered.
+
+    Returns:
+        Optional[Future]: Done once all searches have finished (failures are only logged); None if the URL has no host.
+    """
+    company_id = canonical_company_id(company_url)
+    if not company_id:
+        return None
+    with _inflight_lock:
+        if company_id in _inflight:
+            return _inflight[company_id]
+        done = _inflight[company_id] = Future()
+    steps = [step for step in WORKFLOW_STEPS if step.get("scope") != "industry"]
+    remaining = max(len(steps), 1)
+    logging.info(f"Prefetching {len(steps)} searches for {company_id}")
+
+    def step_done(_):
+        nonlocal remaining
+        with _inflight_lock:
+            remaining -= 1
+            if remaining > 0:
+                return
+            _inflight.pop(company_id, None)
+        done.set_result(None)
+
+    if not steps:
+        step_done(None)
+    for step in steps:
+        _executor.submit(_prefetch_step, step, company_id).add_done_callback(step_done)
+    return done
@@ -0,0 +1,265 @@
+"""
+Process-wide rate limiting for provider calls, configured via RATE_LIMITS in model_config.py.
+
+Each limiter combines a requests-per-minute and a tokens-per-minute token bucket with an optional cap on
+concurrent calls. Callers queue (FIFO) instead of firing requests that would come back as 429s; time spent
+waiting is recorded per limiter.
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager, ExitStack
+from typing import Dict, List, Optional
+from model_config import RATE_LIMITS
+
+LOG_WAIT_THRESHOLD = 1.0  # seconds; longer waits are logged
+WAIT_THRESHOLD = 0.001  # seconds; shorter waits are just lock/bookkeeping overhead and not counted as waits
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth.
+
+    Reservations are taken immediately and may drive the level negative; the caller then waits until the
+    refill has paid off the debt, which queues callers in arrival order without holding the lock while waiting.
+
+    Args:
+        rate_per_minute (float): The sustained rate, e.g. requests or tokens per minute.
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_second)
+            self._updated = now
+            self._level -= min(amount, self.capacity)  # a single call larger than the bucket would wait forever
+            return max(0.0, -self._level / self.rate_per_second)
+
+    def adjust(self, amount: float):
+        """Take (or with a negative amount give back) tokens after the fact, e.g. once actual usage is known."""
+        with self._lock:
+            self._level = min(self.capacity, self._level - amount)
+
+class FairSlots:
+    """
+    Cap on concurrent calls, shared by threads and event loops; waiters get free slots in arrival order.
+
+    A released slot is handed straight to the oldest waiter (a threading.Event for threads, an asyncio.Future on its
+    own loop for tasks), so later arrivals can't overtake it.
+
+    Args:
+        limit (int): Max. slots in use.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()  # set by release once the slot is ours
+
+    async def async_acquire(self):
+        """Async version of acquire; a task cancelled while waiting gives up its place, or its slot if already granted."""
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except BaseException:
+            with self._lock:
+                granted = future not in self._waiters  # release removes a waiter from the queue when granting it
+                if not granted:
+                    self._waiters.remove(future)
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                try:
+                    waiter.get_loop().call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+                    return
+                except RuntimeError:  # its event loop is closed; the waiter is gone
+                    continue
+            self._in_use -= 1
+
+class RateLimiter:
+    """
+    Requests/min, tokens/min and concurrency limits for one provider or model.
+
+    Args:
+        name (str): The provider or model name, used in logs and stats.
+        rpm (float, optional): Max. requests per minute. Defaults to None (unlimited).
+        tpm (float, optional): Max. tokens per minute. Defaults to None (unlimited).
+        max_concurrency (int, optional): Max. calls in flight. Defaults to None (unlimited).
+    """
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.slots = FairSlots(max_concurrency) if max_concurrency else None
+        self._stats = {"calls": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def _refund(self, tokens: int):
+        # gives back what _reserve took, for calls that gave up while waiting for their reservation
+        if self.requests:
+            self.requests.adjust(-1)
+        if self.tokens and tokens:
+            self.tokens.adjust(-min(tokens, self.tokens.capacity))
+
+    def _record(self, waited: float, tokens: int):
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            self._stats["tokens"] += tokens
+            if waited >= WAIT_THRESHOLD:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        if waited >= LOG_WAIT_THRESHOLD:
+            logging.info(f"Rate limiter {self.name}: waited {waited:.1f}s")
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a call with the given token estimate may start; returns the seconds waited."""
+        start = time.monotonic()
+        if self.slots:
+            self.slots.acquire()
+        try:
+            time.sleep(self._reserve(tokens))
+        except BaseException:  # e.g. KeyboardInterrupt; the caller never gets to release
+            self._give_up(tokens)
+            raise
+        waited = time.monotonic() - start
+        self._record(waited, tokens)
+        return waited
+
+    async def async_acquire(self, tokens: int = 0) -> float:
+        """Async version of acquire; waits without blocking the event loop."""
+        start = time.monotonic()
+        if self.slots:
+            await self.slots.async_acquire()
+        try:
+            await asyncio.sleep(self._reserve(tokens))
+        except BaseException:  # cancelled, e.g. the losing request of a hedged call or a timeout
+            self._give_up(tokens)
+            raise
+        waited = time.monotonic() - start
+        self._record(waited, tokens)
+        return waited
+
+    def _give_up(self, tokens: int):
+        self._refund(tokens)
+        if self.slots:
+            self.slots.release()
+
+    def release(self, reserved_tokens: int = 0, used_tokens: Optional[int] = None):
+        """Free the concurrency slot and correct the token bucket by actual usage, if known."""
+        if self.slots:
+            self.slots.release()
+        if self.tokens and used_tokens is not None:
+            self.tokens.adjust(used_tokens - reserved_tokens)
+            with self._stats_lock:
+                self._stats["tokens"] += used_tokens - reserved_tokens
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+class Permit:
+    """Handed out by limited/async_limited; set used_tokens once actual usage is known."""
+    def __init__(self, reserved_tokens: int):
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None
+        self.waited = 0.0
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(name: str) -> Optional[RateLimiter]:
+    """
+    Get the shared limiter for a provider or model; None if RATE_LIMITS has no entry for it.
+
+    Args:
+        name (str): The provider (e.g. "tavily", "vertex_ai") or model name.
+
+    Returns:
+        Optional[RateLimiter]: The limiter.
+    """
+    with _limiters_lock:
+        if name not in _limiters and name in RATE_LIMITS:
+            _limiters[name] = RateLimiter(name, **RATE_LIMITS[name])
+        return _limiters.get(name)
+
+def llm_limiter_names(model: str) -> List[str]:
+    # limits apply per provider (shared quota across its models) and per model
+    provider = model.split("/", 1)[0] if "/" in model else "openai"
+    return [provider, model]
+
+@contextmanager
+def limited(names: List[str], tokens: int = 0):
+    """
+    Wait for all named limiters (those without config are skipped) and hold them for the duration of a call.
+
+    Args:
+        names (List[str]): The providers/models the call counts against.
+        tokens (int, optional): The estimated tokens of the call (prompt + max. completion). Defaults to 0.
+
+    Yields:
+        Permit: Set its used_tokens to correct the token buckets by actual usage.
+    """
+    permit = Permit(tokens)
+    with ExitStack() as stack:
+        for limiter in filter(None, map(get_limiter, names)):
+            permit.waited += limiter.acquire(tokens)
+            stack.callback(lambda limiter=limiter: limiter.release(permit.reserved_tokens, permit.used_tokens))
+        yield permit
+
+@asynccontextmanager
+async def async_limited(names: List[str], tokens: int = 0):
+    """Async version of limited."""
+    permit = Permit(tokens)
+    with ExitStack() as stack:
+        for limiter in filter(None, map(get_limiter, names)):
+            permit.waited += await limiter.async_acquire(tokens)
+            stack.callback(lambda limiter=limiter: limiter.release(permit.reserved_tokens, permit.used_tokens))
+        yield permit
+
+def get_rate_limiter_stats() -> Dict[str, Dict]:
+    """
+    Get calls, tokens and time spent waiting per limiter used so far in this process.
+
+    Returns:
+        Dict[str, Dict]: The stats by provider/model name.
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,181 @@
+"""
+Retries with exponential backoff and jitter for transient provider errors, plus optional hedged LLM requests:
+if the primary model hasn't answered within its recent p95 latency, the same request is also sent to the
+fallback model and whichever answers first is used. Fallback chains try the next model of a stage (see MODEL_ROUTES)
+once a model has failed for good.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Any, Awaitable, Dict, List, Optional
+from tracing import submit_traced
+from model_config import MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, HEDGE_DEFAULT_DELAY, HEDGE_MIN_SAMPLES
+
+# Matched by name so provider libraries (litellm, tavily, requests, httpx) needn't be imported here
+_TRANSIENT_ERROR_NAMES = {
+    "Timeout", "TimeoutError", "TimeoutException", "ConnectTimeout", "ReadTimeout", "ConnectError", "ConnectionError",
+    "APIConnectionError", "RateLimitError", "ServiceUnavailableError", "InternalServerError",
+}
+_LATENCY_WINDOW = 100  # recent calls per model used for the p95
+
+def is_transient(e: BaseException) -> bool:
+    """
+    Whether an error is worth retrying: timeouts, connection problems, rate limiting and server errors.
+
+    Args:
+        e (BaseException): The error raised by a provider call.
+
+    Returns:
+        bool: True if the call may succeed when retried.
+    """
+    if isinstance(e, (TimeoutError, ConnectionError)) or type(e).__name__ in _TRANSIENT_ERROR_NAMES:
+        return True
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return isinstance(status, int) and (status in (408, 409, 429) or status >= 500)
+
+def backoff_delay(attempt: int) -> float:
+    # "full jitter": spreads retries of many concurrent callers instead of having them retry in lockstep
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def with_retries(fn: Callable[[], Any], description: str, retries: int = MAX_RETRIES) -> Any:
+    """
+    Call fn, retrying transient errors with exponential backoff and jitter.
+
+    Args:
+        fn (Callable[[], Any]): The call to make.
+        description (str): What is being called, for logging.
+        retries (int, optional): Max. retries after the first attempt. Defaults to MAX_RETRIES.
+
+    Returns:
+        Any: The result of fn.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"{description} failed ({type(e).__name__}: {str(e)[:200]}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+async def async_with_retries(fn: Callable[[], Awaitable[Any]], description: str, retries: int = MAX_RETRIES) -> Any:
+    """Async version of with_retries."""
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"{description} failed ({type(e).__name__}: {str(e)[:200]}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def with_fallbacks(fn: Callable[[str], Any], models: List[str], description: str) -> Any:
+    """
+    Call fn with each model in turn until one succeeds, e.g. when the primary model's provider is down.
+
+    Args:
+        fn (Callable[[str], Any]): The call to make with a model name (with its own retries).
+        models (List[str]): The models in order of preference, see utils.model_chain.
+        description (str): What is being called, for logging.
+
+    Returns:
+        Any: The result of fn for the first model that succeeded.
+    """
+    for i, model in enumerate(models):
+        try:
+            return fn(model)
+        except Exception as e:
+            if i == len(models) - 1:
+                raise
+            logging.warning(f"{description} with {model} failed ({type(e).__name__}: {str(e)[:200]}), falling back to {models[i + 1]}")
+
+async def async_with_fallbacks(fn: Callable[[str], Awaitable[Any]], models: List[str], description: str) -> Any:
+    """Async version of with_fallbacks."""
+    for i, model in enumerate(models):
+        try:
+            return await fn(model)
+        except Exception as e:
+            if i == len(models) - 1:
+                raise
+            logging.warning(f"{description} with {model} failed ({type(e).__name__}: {str(e)[:200]}), falling back to {models[i + 1]}")
+
+class LatencyTracker:
+    """Recent call latencies per model, to decide when a request is slow enough to hedge."""
+    def __init__(self):
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=_LATENCY_WINDOW)).append(seconds)
+
+    def p95(self, model: str) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def hedge_delay(self, model: str) -> float:
+        return self.p95(model) or HEDGE_DEFAULT_DELAY
+
+latency_tracker = LatencyTracker()
+# losing hedged requests can't be cancelled and finish in the background, hence a pool of its own
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+def hedged_call(primary: Callable[[], Any], fallback: Callable[[], Any], hedge_after: float, description: str) -> Any:
+    """
+    Run primary; if it hasn't finished after hedge_after seconds (or fails), also run fallback and return
+    whichever succeeds first.
+
+    Args:
+        primary (Callable[[], Any]): The preferred call.
+        fallback (Callable[[], Any]): The backup call.
+        hedge_after (float): Seconds to wait for primary before starting fallback.
+        description (str): What is being called, for logging.
+
+    Returns:
+        Any: The first successful result; raises the primary's error if both fail.
+    """
+    primary_future = submit_traced(_hedge_executor, primary)
+    done, _ = wait([primary_future], timeout=hedge_after)
+    if done and primary_future.exception() is None:
+        return primary_future.result()
+
+    logging.info(f"{description}: primary {'failed' if done else f'slower than {hedge_after:.1f}s'}, hedging with fallback")
+    fallback_future = submit_traced(_hedge_executor, fallback)
+    pending = {fallback_future} if done else {primary_future, fallback_future}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    raise primary_future.exception()
+
+async def async_hedged_call(primary: Callable[[], Awaitable[Any]], fallback: Callable[[], Awaitable[Any]],
+                            hedge_after: float, description: str) -> Any:
+    """Async version of hedged_call; the losing request is cancelled."""
+    primary_task = asyncio.ensure_future(primary())
+    done, _ = await asyncio.wait([primary_task], timeout=hedge_after)
+    if done and primary_task.exception() is None:
+        return primary_task.result()
+
+    logging.info(f"{description}: primary {'failed' if done else f'slower than {hedge_after:.1f}s'}, hedging with fallback")
+    fallback_task = asyncio.ensure_future(fallback())
+    pending = {fallback_task} if done else {primary_task, fallback_task}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise primary_task.exception()
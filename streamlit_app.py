@@ -1,163 +1,109 @@
 import streamlit as st
 st.set_page_config(page_title="Company Research Workflow") # needs to stay here to avoid issues
 
-from typing import List, Callable
-import threading
 import time
-from streamlit.runtime.scriptrunner import add_script_run_ctx
-from workflow_steps import WORKFLOW_STEPS, SUMMARY_BEGINNING_OF_PROMPT, SUMMARY_END_OF_PROMPT, DRAFT_EMAIL_PROMPT
+from workflow_steps import WORKFLOW_STEPS
 from env_config import setup_environment, setup_logging
-from utils import prompt_model, run_step, initialize_clients
-import base64
-from weasyprint import HTML
-from io import BytesIO
+from utils import initialize_clients
+from model_config import METRICS_PORT, PREFETCH_ON_INPUT
+from rate_limiter import get_rate_limiter_stats
+from tracing import summarize_spans, render_prometheus, start_metrics_server
+import job_queue
+from company_identity import canonical_company_id
+from pdf_report import get_pdf_future
 
 # Setup environment and logging, initialize clients, setup cache for slow/expensive functions
 DEBUG_MODE = False # remember to set DEBUG_MODE = False before deploying
-setup_environment()
-setup_logging(debug_mode=DEBUG_MODE)
+WORKER_HINT_AFTER = 30 # seconds a job may stay queued before the UI hints that no worker is running
+
+@st.cache_resource
+def setup_process():
+    # once per process instead of on every rerun and session; provider libraries are only imported on first use (see utils.py)
+    setup_environment()
+    setup_logging(debug_mode=DEBUG_MODE)
+    initialize_clients(mock_clients=False) # DEBUG; remember to disable before deploying
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+setup_process()
 import logging
-initialize_clients(mock_clients=False) # DEBUG; remember to disable before deploying
 
-from diskcache import Cache
-cache = Cache('/tmp/mycache')
+# bug in streamlit 1.37 causes @st.cache_data functions to not be thread safe (https://github.com/streamlit/streamlit/issues/9260), hence diskcache
+from cache_utils import cached_prompt_model, get_cache_stats
+from document_store import get_document_store_stats
+from prefetch import prefetch_company
 
 st.title("Company Research Workflow")
 st.header("JN test")
 st.write("")
 
-# Initialize session state
+# Initialize session state; results live in the job queue (see job_queue.py and worker.py), keyed by the run ID, which
+# is also kept in the URL so a refresh or a new session on the same link shows the run
+if 'run_id' not in st.session_state:
+    run = job_queue.get_run(st.query_params["run_id"]) if "run_id" in st.query_params else None
+    st.session_state.run_id = run["run_id"] if run else None
+    st.session_state.company_url = run["company_url"] if run else ""
 if 'company_url' not in st.session_state:
     st.session_state.company_url = ""
-if 'step_results' not in st.session_state:
-    st.session_state.step_results = [""] * len(WORKFLOW_STEPS)
-if 'summary_result' not in st.session_state:
-    st.session_state.summary_result = ""
 if 'model_response' not in st.session_state:
     st.session_state.model_response = ""
-if 'is_step_running' not in st.session_state:
-    st.session_state.is_step_running = [False] * len(WORKFLOW_STEPS)
-if 'step_start_time' not in st.session_state:
-    st.session_state.step_start_time = [None] * len(WORKFLOW_STEPS)
-if 'is_summary_running' not in st.session_state:
-    st.session_state.is_summary_running = False
-if 'summary_start_time' not in st.session_state:
-    st.session_state.summary_start_time = None
-if 'is_step_done' not in st.session_state:
-    st.session_state.is_step_done = [False] * len(WORKFLOW_STEPS)
-if 'is_summary_done' not in st.session_state:
-    st.session_state.is_summary_done = False
-if 'summary_queued' not in st.session_state:
-    st.session_state.summary_queued = False
-if 'is_draft_email_running' not in st.session_state:
-    st.session_state.is_draft_email_running = False
-if 'draft_email_start_time' not in st.session_state:
-    st.session_state.draft_email_start_time = None
-if 'is_draft_email_done' not in st.session_state:
-    st.session_state.is_draft_email_done = False
-if 'draft_email_queued' not in st.session_state:
-    st.session_state.draft_email_queued = False
-if 'draft_email_result' not in st.session_state:
-    st.session_state.draft_email_result = ""
-
-def get_is_any_process_running():
-    return any(st.session_state.is_step_running) or st.session_state.is_summary_running or st.session_state.is_draft_email_running
-
-def get_is_analysis_running():
-    return get_is_any_process_running() or st.session_state.summary_queued or st.session_state.draft_email_queued
-
-def get_is_anything_marked_done():
-    return st.session_state.is_summary_done or st.session_state.is_draft_email_done or any(st.session_state.is_step_done)
-
-def set_everthing_not_done():
-    st.session_state.is_summary_done = False
-    st.session_state.is_draft_email_done = False
-    st.session_state.is_step_done = [False] * len(WORKFLOW_STEPS)
-
-#@st.cache_data # bug in streamlit 1.37 causes cached functions to not be thread safe (https://github.com/streamlit/streamlit/issues/9260)
-@cache.memoize()
-def cached_prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None, **kwargs):
-    returnval = prompt_model(prompt, max_tokens, role, response_model, **kwargs)
-    return returnval
-
-#@st.cache_data# bug in streamlit 1.37 causes cached functions to not be thread safe (https://github.com/streamlit/streamlit/issues/9260)
-@cache.memoize()
-def cached_run_step(step: dict, company_url: str):
-    returnval = run_step(step, company_url)
-    return returnval
+
+def get_jobs():
+    # latest job per panel, read fresh by every (fragment) run
+    return job_queue.get_latest_jobs(st.session_state.run_id)
+
+def get_job_result(job):
+    return "" if job is None else job["result"] or job["partial"]
+
+def is_pending(job):
+    return job is not None and job["status"] in job_queue.PENDING
+
+def is_running(job):
+    # partial text is only written while a job runs, so that's when its panel polls; display_progress re-runs the
+    # page when a queued job starts
+    return job is not None and job["status"] == "running"
+
+def get_is_analysis_running(jobs):
+    return any(is_pending(job) for job in jobs.values())
+
+def get_job_states(jobs):
+    return {slot: (job["job_id"], job["status"]) for slot, job in jobs.items()}
+
+jobs = get_jobs()
+# everything up to now is rendered by this run; the progress fragment re-runs the page when a job changes state after it
+st.session_state.job_states_seen = get_job_states(jobs)
+
+def start_run() -> str:
+    # a new run per analysed company (by company ID, so "acme.com" and "https://www.acme.com/" are the same company);
+    # single steps, the summary and the email are added to the current run
+    st.session_state.run_id = job_queue.create_run(canonical_company_id(st.session_state.company_url))
+    st.query_params["run_id"] = st.session_state.run_id
+    return st.session_state.run_id
+
+def get_current_run() -> str:
+    run = job_queue.get_run(st.session_state.run_id) if st.session_state.run_id else None
+    if run is None or run["company_url"] != canonical_company_id(st.session_state.company_url):
+        return start_run()
+    return run["run_id"]
 
 def run_step_helper(step_index: int):
-    if st.session_state.company_url:
-        st.session_state.is_step_running[step_index] = True
-        st.session_state.step_start_time[step_index] = time.time()
-        
-        def work_process():
-            try:
-                company_url = st.session_state.company_url
-                result = cached_run_step(WORKFLOW_STEPS[step_index], company_url)
-                st.session_state.step_results[step_index] = result
-            except Exception as e:
-                logging.error(f"Error in step {step_index}: {str(e)}")
-                st.session_state.step_results[step_index] = f"Error occurred during step {step_index}."
-            finally:
-                st.session_state.is_step_running[step_index] = False
-                st.session_state.step_start_time[step_index] = None
-                st.session_state.is_step_done[step_index] = True
-                logging.info(f"Step {step_index} work process completed")
-
-        thread = threading.Thread(target=work_process, daemon=True)
-        add_script_run_ctx(thread)
-        thread.start()
+    if canonical_company_id(st.session_state.company_url):
+        job_queue.submit_job(get_current_run(), "step", step_index)
     else:
         st.error("Please enter a company URL.")
 
 def run_summary_helper():
-    if any(st.session_state.step_results):
-        st.session_state.is_summary_running = True
-        st.session_state.summary_start_time = time.time()
-        summary_prompt = SUMMARY_BEGINNING_OF_PROMPT + "\n ***** \n" + "\n\n".join(st.session_state.step_results) + "\n ***** \n" + SUMMARY_END_OF_PROMPT
-        def work_process():
-            try:
-                result = cached_prompt_model(summary_prompt)
-                st.session_state.summary_result = result
-            except Exception as e:
-                logging.error(f"Error in summary generation: {str(e)}")
-                st.session_state.summary_result = "Error occurred during summary generation."
-            finally:
-                st.session_state.is_summary_running = False
-                st.session_state.summary_start_time = None
-                st.session_state.is_summary_done = True
-                logging.info("Summary work process completed")
-
-        thread = threading.Thread(target=work_process, daemon=True)
-        add_script_run_ctx(thread)
-        thread.start()
-    else:
+    # the worker summarizes the latest step results once the run's running steps are done
+    if not any(get_job_result(job) for slot, job in get_jobs().items() if slot.startswith("step_")):
         st.error("No results to analyze.")
+        return
+    job_queue.submit_job(st.session_state.run_id, "summary")
 
 def run_draft_email_helper():
-    if st.session_state.summary_result:
-        st.session_state.is_draft_email_running = True
-        st.session_state.draft_email_start_time = time.time()
-        draft_email_prompt = DRAFT_EMAIL_PROMPT + "\n ***** \n" + st.session_state.summary_result
-        def work_process():
-            try:
-                result = cached_prompt_model(draft_email_prompt)
-                st.session_state.draft_email_result = result
-            except Exception as e:
-                logging.error(f"Error in draft email step: {str(e)}")
-                st.session_state.draft_email_result = "Error occurred during draft email step."
-            finally:
-                st.session_state.is_draft_email_running = False
-                st.session_state.draft_email_start_time = None
-                st.session_state.is_draft_email_done = True
-                logging.info("Draft email work process completed")
-
-        thread = threading.Thread(target=work_process, daemon=True)
-        add_script_run_ctx(thread)
-        thread.start()
-    else:
+    if not get_job_result(get_jobs().get("summary")):
         st.error("No summary to draft email from.")
+        return
+    job_queue.submit_job(st.session_state.run_id, "draft_email")
 
 ## Button to identify the model (only shown in debug mode)
 if DEBUG_MODE:
@@ -166,53 +112,85 @@ if DEBUG_MODE:
         result = cached_prompt_model("Which model are you? Answer in format: Using model: Vendor, Model")
         st.session_state.model_response = result
     col2.write(f"{st.session_state.model_response}")
-
-@st.fragment(run_every=1.0 if get_is_analysis_running() else None)
+    with st.expander("Cache statistics"):
+        st.json(get_cache_stats())
+    with st.expander("Document store statistics"):
+        st.json(get_document_store_stats())
+    with st.expander("Rate limiter statistics"):
+        st.json(get_rate_limiter_stats())
+    with st.expander("Run trace"):
+        if st.session_state.run_id is not None:
+            spans = job_queue.get_run_spans(st.session_state.run_id)
+            st.write(f"Run {st.session_state.run_id} for {st.session_state.company_url} (finished jobs)")
+            st.dataframe([{"stage": name, **stats} for name, stats in summarize_spans(spans).items()], use_container_width=True)
+            st.dataframe(spans, use_container_width=True)
+        else:
+            st.write("No run yet.")
+    with st.expander("Job queue statistics"):
+        st.json(job_queue.get_queue_stats())
+    with st.expander("Metrics (Prometheus text format)"):
+        st.code(render_prometheus(), language="text")
+
+def prefetch_helper():
+    # start the company's searches speculatively once the URL is committed (Enter or focus change), so most of them
+    # are cache hits by the time "Analyze Company" is clicked
+    if PREFETCH_ON_INPUT:
+        prefetch_company(st.session_state.company_url_input)
+
+@st.fragment
 def display_analyze_company():
-    # Check if summary is queued and no process is running
-    if not get_is_any_process_running() and st.session_state.summary_queued:
-        run_summary_helper()
-        st.session_state.draft_email_queued = True  # Queue draft email step after summary is completed 
-        st.session_state.summary_queued = False # Do after queuing in case of rerun race gone wrong
-    # Check if draft email is queued and no process is running
-    elif not get_is_any_process_running() and st.session_state.draft_email_queued:
-        run_draft_email_helper()
-        st.session_state.draft_email_queued = False
+    is_analysis_running = get_is_analysis_running(get_jobs())
     # Input for company URL
     st.session_state.company_url = st.text_input("Enter company URL:", 
                                                  value=st.session_state.company_url, 
-                                                 disabled=get_is_any_process_running())
-
-    button_text = "Analyze Company"
-    if get_is_any_process_running():
-        running_steps = [i for i, running in enumerate(st.session_state.is_step_running) if running]
-        if running_steps:
-            step_index = running_steps[0]
-            elapsed_time = int(time.time() - st.session_state.step_start_time[step_index])
-            button_text = f"Running Step {step_index + 1}... {elapsed_time}s"
-        elif st.session_state.is_summary_running:
-            elapsed_time = int(time.time() - st.session_state.summary_start_time)
-            button_text = f"Running Summary... {elapsed_time}s"
-        elif st.session_state.is_draft_email_running:
-            elapsed_time = int(time.time() - st.session_state.draft_email_start_time)
-            button_text = f"Drafting Email... {elapsed_time}s"
-
-    if st.button(button_text, use_container_width=True, disabled=get_is_any_process_running()):
-        if st.session_state.company_url: # keep this check even if redundant to avoid re-run
-            for i in range(len(WORKFLOW_STEPS)):
-                run_step_helper(i)
-            st.session_state.summary_queued = True
+                                                 disabled=is_analysis_running,
+                                                 key="company_url_input",
+                                                 on_change=prefetch_helper)
+
+    button_text = "Analyzing..." if is_analysis_running else "Analyze Company"
+    if st.button(button_text, use_container_width=True, disabled=is_analysis_running):
+        if canonical_company_id(st.session_state.company_url): # keep this check even if redundant to avoid re-run
+            # fresh run per full analysis; workers start the summary and email once the steps are done
+            job_queue.submit_analysis(start_run(), len(WORKFLOW_STEPS))
             st.rerun() #required to start run_every for fragments
         else:
             st.error("Please enter a company URL.")
 
 display_analyze_company()
 
+# the only fragment that polls for the whole analysis: a cheap elapsed-time label, plus a full rerun whenever a job
+# started or finished since the page was rendered (so panels start/stop refreshing and show final results)
+@st.fragment(run_every=1.0 if get_is_analysis_running(jobs) else None)
+def display_progress():
+    current_jobs = get_jobs()
+    if get_job_states(current_jobs) != st.session_state.job_states_seen:
+        st.rerun()
+    names = {"summary": "Summary", "draft_email": "Draft Email"}
+    running = [(names.get(slot, f"Step {job['step_index'] + 1}"), job["started_at"])
+               for slot, job in current_jobs.items() if job["status"] == "running"]
+    queued = [job for job in current_jobs.values() if job["status"] == "queued"]
+    if running:
+        st.caption("Running: " + ", ".join(f"{name} {int(time.time() - start_time)}s" for name, start_time in running))
+    elif queued and time.time() - min(job["created_at"] for job in queued) > WORKER_HINT_AFTER:
+        st.caption("Queued... no worker has picked up the jobs yet; is `python worker.py` running?")
+    elif queued:
+        st.caption("Queued...")
+
+display_progress()
+
+def get_button_text(job, idle_text: str, running_text: str = "Running..."):
+    if job is not None and job["status"] == "running":
+        return f"{running_text} {int(time.time() - job['started_at'])}s"
+    if job is not None and job["status"] == "queued":
+        return "Queued..."
+    return idle_text
+
 # Function to create display step functions
 def create_display_step_function(step_index):
-    @st.fragment(run_every=1.0 if (st.session_state.is_step_running[step_index] or get_is_analysis_running()) else None)
+    @st.fragment(run_every=1.0 if is_running(jobs.get(f"step_{step_index}")) else None) # only while its own job is running
     def display_step():
         error_message = None
+        job = get_jobs().get(f"step_{step_index}")
 
         st.write("") #create space
         st.write("") #create space
@@ -220,25 +198,20 @@ def create_display_step_function(step_index):
         with col1:
             st.subheader(WORKFLOW_STEPS[step_index]["step_name"])
         with col2:
-            button_text = "Run Step"
-            if st.session_state.is_step_running[step_index]:
-                elapsed_time = int(time.time() - st.session_state.step_start_time[step_index])
-                button_text = f"Running... {elapsed_time}s"
-            
             if st.button(
-                button_text,
+                get_button_text(job, "Run Step"),
                 key=f"run_step_{step_index}",
-                disabled=st.session_state.is_step_running[step_index],
+                disabled=is_pending(job),
                 use_container_width=True
             ):
-                if st.session_state.company_url: # keep this check even if redundant to avoid re-run
+                if canonical_company_id(st.session_state.company_url): # keep this check even if redundant to avoid re-run
                     run_step_helper(step_index)
                     st.rerun() #required to start run_every for fragment
                 else:
                     error_message = "Please enter a company URL."
         
         if error_message: st.error(error_message) # used to print below column, not in column
-        st.text_area("Output:", value=st.session_state.step_results[step_index], height=150, key=f"step_{step_index}")
+        st.text_area("Output:", value=get_job_result(job), height=150, key=f"step_{step_index}")
 
     return display_step
 
@@ -251,9 +224,11 @@ for i in range(len(WORKFLOW_STEPS)):
     globals()[f'display_step_{i}']()
 
 # Display final summary
-@st.fragment(run_every=1.0 if (st.session_state.is_summary_running or get_is_analysis_running()) else None)
+@st.fragment(run_every=1.0 if is_running(jobs.get("summary")) else None)
 def display_summary():
     error_message = None
+    current_jobs = get_jobs()
+    job = current_jobs.get("summary")
 
     st.write("") #create space
     st.write("") #create space
@@ -261,30 +236,29 @@ def display_summary():
     with col1:
         st.subheader("Final Summary")
     with col2:
-        button_text = "Summarize"
-        if st.session_state.is_summary_running:
-            elapsed_time = int(time.time() - st.session_state.summary_start_time)
-            button_text = f"Running... {elapsed_time}s"
         if st.button(
-            button_text,
-            disabled=st.session_state.is_summary_running,
+            get_button_text(job, "Summarize"),
+            key="run_summary",
+            disabled=is_pending(job),
             use_container_width=True
         ):
-            if any(st.session_state.step_results): # keep this check even if redundant to avoid re-run
+            if any(get_job_result(step_job) for slot, step_job in current_jobs.items() if slot.startswith("step_")): # keep this check even if redundant to avoid re-run
                 run_summary_helper()
                 st.rerun() #required to start run_every for fragment
             else:
                 error_message = "No results to analyze."
     
     if error_message: st.error(error_message) # used to print below column, not in column
-    st.text_area("Output:", value=st.session_state.summary_result, height=400, key="final_summary")
+    st.text_area("Output:", value=get_job_result(job), height=400, key="final_summary")
 
 display_summary()
 
 # Display draft email
-@st.fragment(run_every=1.0 if (st.session_state.is_draft_email_running or get_is_analysis_running()) else None)
+@st.fragment(run_every=1.0 if is_running(jobs.get("draft_email")) else None)
 def display_draft_email():
     error_message = None
+    current_jobs = get_jobs()
+    job = current_jobs.get("draft_email")
 
     st.write("") #create space
     st.write("") #create space
@@ -292,111 +266,50 @@ def display_draft_email():
     with col1:
         st.subheader("Draft Email")
     with col2:
-        button_text = "Draft Email"
-        if st.session_state.is_draft_email_running:
-            elapsed_time = int(time.time() - st.session_state.draft_email_start_time)
-            button_text = f"Drafting... {elapsed_time}s"
         if st.button(
-            button_text,
-            disabled=st.session_state.is_draft_email_running,
+            get_button_text(job, "Draft Email", running_text="Drafting..."),
+            key="run_draft_email",
+            disabled=is_pending(job),
             use_container_width=True
         ):
-            if st.session_state.summary_result: # keep this check even if redundant to avoid re-run
+            if get_job_result(current_jobs.get("summary")): # keep this check even if redundant to avoid re-run
                 run_draft_email_helper()
                 st.rerun() #required to start run_every for fragment
             else:
                 error_message = "No summary to draft email from."
     
     if error_message: st.error(error_message) # used to print below column, not in column
-    st.text_area("Output:", value=st.session_state.draft_email_result, height=400, key="draft_email")
+    st.text_area("Output:", value=get_job_result(job), height=400, key="draft_email")
 
 display_draft_email()
 
-def generate_pdf():
-    html_template = """
-    <html>
-    <head>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                color: black;
-                font-size: 12px;
-            }}
-            h1, h2 {{
-                color: #00008B;  /* Dark Blue */
-            }}
-            h1 {{
-                font-size: 18px;
-                margin-bottom: 10px;
-            }}
-            h2 {{
-                font-size: 16px;
-                margin-bottom: 5px;
-            }}
-            .section {{
-                margin-bottom: 15px;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1>Company Analysis Report</h1>
-        
-        <div class="section">
-            <h2>Draft Email</h2>
-            <p>{draft_email}</p>
-        </div>
-        
-        <div class="section">
-            <h2>Final Summary</h2>
-            <p>{summary}</p>
-        </div>
-        
-        {steps}
-    </body>
-    </html>
-    """
-    
-    steps_html = []
-    for i in range(len(WORKFLOW_STEPS)):
-        step_html = """
-        <div class="section">
-            <h2>Step {step_number}: {step_name}</h2>
-            <p>{step_result}</p>
-        </div>
-        """.format(
-            step_number=i+1,
-            step_name=WORKFLOW_STEPS[i]['step_name'],
-            step_result=st.session_state.step_results[i].replace('\n', '<br>')
-        )
-        steps_html.append(step_html)
-    
-    html_content = html_template.format(
-        draft_email=st.session_state.draft_email_result.replace('\n', '<br>'),
-        summary=st.session_state.summary_result.replace('\n', '<br>'),
-        steps=''.join(steps_html)
-    )
-    
-    pdf_file = BytesIO()
-    HTML(string=html_content).write_pdf(pdf_file)
-    pdf_file.seek(0)
-    return pdf_file
+def get_pdf_inputs():
+    step_results = [get_job_result(jobs.get(f"step_{i}")) for i in range(len(WORKFLOW_STEPS))]
+    return [step["step_name"] for step in WORKFLOW_STEPS], step_results, get_job_result(jobs.get("summary")), get_job_result(jobs.get("draft_email"))
+
+# Render the PDF only once results are final, in a worker process and memoized by content (see pdf_report.py)
+is_report_final = not get_is_analysis_running(jobs) and any(get_job_result(job) for job in jobs.values())
+if is_report_final:
+    pdf_future = get_pdf_future(*get_pdf_inputs())
+
+@st.fragment(run_every=1.0 if is_report_final and not pdf_future.done() else None)
+def display_pdf_download():
+    st.write("")
+    if not is_report_final:
+        st.button("Download as PDF", disabled=True, use_container_width=True, key="pdf_not_ready")
+    elif not pdf_future.done():
+        st.button("Preparing PDF...", disabled=True, use_container_width=True, key="pdf_preparing")
+    elif pdf_future.exception() is not None:
+        logging.error(f"Error in PDF generation: {str(pdf_future.exception())}")
+        st.error("Error occurred during PDF generation.")
+    else:
+        if st.download_button(
+            label="Download as PDF",
+            data=pdf_future.result(),
+            file_name="company_analysis.pdf",
+            mime="application/pdf",
+            use_container_width=True
+        ):
+            st.success("PDF generated successfully!")
 
-# Download PDF button
-st.write("")
-if st.download_button(
-    label="Download as PDF",
-    data=generate_pdf(),
-    file_name="company_analysis.pdf",
-    mime="application/pdf",
-    use_container_width=True
-):
-    st.success("PDF generated successfully!")
-
-# invisible fragment to trigger global rerun to reset all fragments' run_every once nothing is running anymore; should always stay at end of file
-@st.fragment(run_every=1.0 if (get_is_any_process_running() or get_is_analysis_running()) else None)
-def invisible_fragment_to_rerun_when_all_done():
-    #trigger rerun if any steps are marked done and nothing is running anymore
-    if get_is_anything_marked_done() and not (get_is_any_process_running() or get_is_analysis_running()):
-        set_everthing_not_done()
-        st.rerun()
-invisible_fragment_to_rerun_when_all_done()
+display_pdf_download()
@@ -0,0 +1,14 @@
+import pytest
+from company_identity import normalize_company_url, canonical_company_id
+
+@pytest.mark.parametrize("company_url", ["acme.com", "https://www.acme.com/", "ACME.com/about", "http://acme.com:8080?x=1", "www.acme.com."])
+def test_spellings_share_one_id(company_url):
+    assert normalize_company_url(company_url) == "acme.com"
+
+@pytest.mark.parametrize("company_url", ["http://[acme", "[acme", "https://[::1/about"])
+def test_malformed_url_has_no_id(company_url):
+    assert normalize_company_url(company_url) == ""
+    assert canonical_company_id(company_url) == ""
+
+def test_empty_url_has_no_id():
+    assert canonical_company_id("   ") == ""
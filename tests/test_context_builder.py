@@ -0,0 +1,21 @@
+import pytest
+from context_builder import clean_text
+
+@pytest.mark.parametrize("fact", ["Founded in 2015", "Series B, $40M", "Headquarters: Berlin", "Founded 2015 | Berlin | 200 employees"])
+def test_short_fact_is_kept(fact):
+    assert clean_text(f"Acme builds HR software for mid-sized companies.\n{fact}") == \
+        f"Acme builds HR software for mid-sized companies. {fact}"
+
+@pytest.mark.parametrize("line", [
+    "Home",
+    "About us",
+    "Home | Products | Pricing | Contact",
+    "[Products](/products) [Pricing](/pricing) [Blog](/blog)",
+    "We use cookies to improve your experience. Accept all",
+    "© 2024 Acme Inc. All rights reserved.",
+])
+def test_navigation_and_banners_are_dropped(line):
+    assert clean_text(f"{line}\nAcme builds HR software.") == "Acme builds HR software."
+
+def test_inline_links_keep_their_text():
+    assert clean_text("Acme was [founded](https://acme.com/about) by Jane Doe in 2015.") == "Acme was founded by Jane Doe in 2015."
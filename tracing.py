@@ -0,0 +1,263 @@
+"""
+Per-run tracing and process-wide latency/cost metrics.
+
+Code wraps each stage in span(...) and annotates it with tokens, cost or cache hits. Spans are collected into the
+current Trace (one per analysis run, carried in a contextvar, so it has to be passed to worker threads with
+use_trace) and always aggregated into process-wide metrics, which are exposed in Prometheus text format via
+render_prometheus, write_metrics_file or a small local HTTP endpoint (start_metrics_server).
+"""
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any, Callable
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)  # seconds
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id, "start": self.start,
+                "duration": round(self.duration, 4), "error": self.error, **self.attributes}
+
+class Trace:
+    """
+    The spans of one analysis run.
+
+    Make it current with use_trace in every thread that works on the run (or submit work with submit_traced).
+
+    Args:
+        name (str): What is being traced, e.g. the company URL.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.start = time.time()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self) -> List[Dict]:
+        with self._lock:
+            return [span.to_dict() for span in self.spans]
+
+    def summary(self) -> Dict[str, Dict]:
+        """Aggregate the spans by name, see summarize_spans."""
+        return summarize_spans(self.to_list())
+
+def summarize_spans(spans: List[Dict]) -> Dict[str, Dict]:
+    """
+    Aggregate spans (as from Trace.to_list, possibly of several traces) by name.
+
+    Args:
+        spans (List[Dict]): The spans.
+
+    Returns:
+        Dict[str, Dict]: Per span name: count and total seconds, plus tokens, cost, cache hits/misses and errors where non-zero.
+    """
+    summary = {}
+    for span in spans:
+        stats = summary.setdefault(span["name"], {"count": 0, "seconds": 0.0})
+        stats["count"] += 1
+        stats["seconds"] = round(stats["seconds"] + span["duration"], 4)
+        for key in ("input_tokens", "output_tokens", "cost"):
+            if span.get(key):
+                stats[key] = stats.get(key, 0) + span[key]
+        if "cache_hit" in span:
+            key = "cache_hits" if span["cache_hit"] else "cache_misses"
+            stats[key] = stats.get(key, 0) + 1
+        if span["error"] is not None:
+            stats["errors"] = stats.get("errors", 0) + 1
+    return summary
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Make trace current for the duration of the block, e.g. in a worker thread."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage; the span is added to the current trace (if any) and to the process-wide metrics.
+
+    Args:
+        name (str): The stage name, e.g. "search", "llm", "cache.search".
+        **attributes: Initial attributes, e.g. model or step name.
+
+    Yields:
+        Span: The span; add attributes (input_tokens, output_tokens, cost, cache_hit) while it runs.
+    """
+    parent = _current_span.get()
+    current = Span(name=name, span_id=uuid.uuid4().hex[:8], parent_id=parent.span_id if parent else None,
+                   start=time.time(), attributes=dict(attributes))
+    token = _current_span.set(current)
+    start_time = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {str(e)[:200]}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start_time
+        _current_span.reset(token)
+        _finish(current)
+
+def record_span(name: str, duration: float, **attributes):
+    """Record an already measured stage, e.g. the time a job waited for a worker thread."""
+    parent = _current_span.get()
+    _finish(Span(name=name, span_id=uuid.uuid4().hex[:8], parent_id=parent.span_id if parent else None,
+                 start=time.time() - duration, duration=duration, attributes=attributes))
+
+def annotate(**attributes):
+    """Add attributes to the innermost current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+def _finish(finished: Span):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(finished)
+    metrics.observe(finished)
+
+class Metrics:
+    """Process-wide aggregates of all spans, rendered in Prometheus text format."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations: Dict[str, List[float]] = {}  # name -> [bucket counts..., sum, count]
+        self._counters: Dict[tuple, float] = {}
+
+    def _inc(self, metric: str, labels: tuple, amount: float = 1):
+        self._counters[(metric, labels)] = self._counters.get((metric, labels), 0) + amount
+
+    def observe(self, finished: Span):
+        attributes = finished.attributes
+        with self._lock:
+            histogram = self._durations.setdefault(finished.name, [0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if finished.duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += finished.duration
+            histogram[-1] += 1
+            if finished.error:
+                self._inc("errors_total", (("span", finished.name),))
+            for direction in ("input", "output"):
+                if attributes.get(f"{direction}_tokens"):
+                    self._inc("llm_tokens_total", (("span", finished.name), ("direction", direction)), attributes[f"{direction}_tokens"])
+            if attributes.get("cost"):
+                self._inc("llm_cost_usd_total", (("span", finished.name),), attributes["cost"])
+            if "cache_hit" in attributes:
+                self._inc("cache_requests_total", (("span", finished.name), ("result", "hit" if attributes["cache_hit"] else "miss")))
+
+    def render_prometheus(self) -> str:
+        def labels_text(labels: tuple) -> str:
+            return ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels)
+
+        lines = ["# TYPE sourcing_span_duration_seconds histogram"]
+        with self._lock:
+            for name, histogram in sorted(self._durations.items()):
+                span_label = labels_text((("span", name),))
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    lines.append(f'sourcing_span_duration_seconds_bucket{{{span_label},le="{bound}"}} {count}')
+                lines.append(f'sourcing_span_duration_seconds_bucket{{{span_label},le="+Inf"}} {histogram[-1]}')
+                lines.append(f"sourcing_span_duration_seconds_sum{{{span_label}}} {histogram[-2]:.6f}")
+                lines.append(f"sourcing_span_duration_seconds_count{{{span_label}}} {histogram[-1]}")
+            for metric in sorted({metric for metric, _ in self._counters}):
+                lines.append(f"# TYPE sourcing_{metric} counter")
+                for (name, labels), value in sorted(self._counters.items()):
+                    if name == metric:
+                        lines.append(f"sourcing_{metric}{{{labels_text(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def render_prometheus() -> str:
+    return metrics.render_prometheus()
+
+def write_metrics_file(path: str):
+    """Write the process-wide metrics to a file, e.g. for the node exporter's textfile collector."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_lock = threading.Lock()
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Serve the process-wide metrics at http://host:port/metrics from a daemon thread; no-op if already running.
+
+    Args:
+        port (int): The port to listen on.
+        host (str, optional): The interface to bind. Defaults to localhost only.
+    """
+    global _metrics_server
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep scrapes out of the application log
+
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logging.error(f"Error starting metrics server on port {port}: {str(e)}")
+            return
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True, name="metrics-server").start()
+        logging.info(f"Serving metrics at http://{host}:{port}/metrics")
+
+def submit_traced(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """
+    Submit fn to an executor in a copy of the caller's context, so its spans end up in the caller's trace.
+    The time the call queues for a free worker is recorded as a "thread_wait" span.
+
+    Args:
+        executor (Executor): The executor to run fn on.
+        fn (Callable): The function to run.
+
+    Returns:
+        Future: The future of fn's result.
+    """
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def run():
+        record_span("thread_wait", time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+
+    return executor.submit(context.run, run)
@@ -1,30 +1,76 @@
 import os
+import re
 import logging
 import time
-from typing import Dict
-import litellm
-from litellm import completion_cost
-import instructor
-from tavily import TavilyClient
-from model_config import MODEL_NAME, TEMPERATURE, TOP_P, FREQUENCY_PENALTY, PRESENCE_PENALTY
-
-# Global variables for clients
+import threading
+from urllib.parse import urlsplit
+from typing import Dict, List, Iterator, Callable, Optional
+from model_config import MODEL_NAME, MODEL_ROUTES, TEMPERATURE, TOP_P, FREQUENCY_PENALTY, PRESENCE_PENALTY, CONTEXT_TOKEN_BUDGET, PASSAGE_TOP_K, \
+    LLM_TIMEOUT, SEARCH_TIMEOUT, MAX_RETRIES, HEDGE_REQUESTS, FALLBACK_MODEL_NAME, EXTRACT_BATCH_SIZE, \
+    EXCLUDED_FILE_EXTENSIONS, BLOCKED_DOMAINS, FIXTURES_DIR
+from context_builder import build_context, estimate_tokens
+from rate_limiter import limited, llm_limiter_names
+from resilience import with_retries, with_fallbacks, hedged_call, latency_tracker, is_transient, backoff_delay
+from tracing import span, annotate
+from log_utils import audit_log
+from company_identity import canonical_company_id
+from workflow_steps import WORKFLOW_STEPS, SUMMARY_BEGINNING_OF_PROMPT, SUMMARY_END_OF_PROMPT, DRAFT_EMAIL_PROMPT, STEP_CONDENSE_PROMPT, \
+    INDUSTRY_CLASSIFICATION_PROMPT
+
+# Global variables for clients; created on first use by _ensure_clients, once per process
 tavily_client = None
 instructorlitellm_client = None
+litellm_client = None  # plain litellm, used for streaming (instructor only streams structured outputs)
+_use_mock_clients = False
+_fixtures = (None, None)  # (mode, directory): record real responses to, or replay them from, fixtures (see fixtures.py)
+_clients_lock = threading.Lock()
 
-def initialize_clients(mock_clients=False):
-    global tavily_client, instructorlitellm_client
-    
-    if mock_clients:
-        instructorlitellm_client = _mock_instructorlitellm_client()
-        tavily_client = _mock_tavily_client()
-    else:
-        instructorlitellm_client = instructor.from_litellm(litellm.completion)
-        try:
-            tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
-        except KeyError:
-            logging.error("Error initialising Tavily client. Missing API key?")
-            tavily_client = None
+def initialize_clients(mock_clients=False, fixtures_mode: Optional[str] = None, fixtures_dir: str = FIXTURES_DIR):
+    # cheap and safe to call on every Streamlit rerun: litellm, instructor and tavily are only imported (which takes
+    # seconds) and the clients only created when first needed, and only re-created if the settings change;
+    # fixtures_mode "record" wraps the real clients to save their responses, "replay" serves saved ones instead
+    global tavily_client, instructorlitellm_client, litellm_client, _use_mock_clients, _fixtures
+
+    if fixtures_mode not in (None, "record", "replay"):
+        raise ValueError(f"Unknown fixtures mode: {fixtures_mode}")
+    fixtures = (fixtures_mode, fixtures_dir if fixtures_mode else None)
+    with _clients_lock:
+        if mock_clients != _use_mock_clients or fixtures != _fixtures:
+            tavily_client = instructorlitellm_client = litellm_client = None
+        _use_mock_clients = mock_clients
+        _fixtures = fixtures
+
+def _ensure_clients():
+    global tavily_client, instructorlitellm_client, litellm_client
+
+    if instructorlitellm_client is not None:
+        return
+    with _clients_lock:
+        if instructorlitellm_client is not None:
+            return
+        fixtures_mode, fixtures_dir = _fixtures
+        if _use_mock_clients:
+            litellm_client = _mock_litellm_client()
+            tavily_client = _mock_tavily_client()
+            instructorlitellm_client = _mock_instructorlitellm_client()
+        elif fixtures_mode == "replay":
+            from fixtures import replay_clients
+            litellm_client, tavily_client, instructorlitellm_client = replay_clients(fixtures_dir)
+        else:
+            import litellm
+            import instructor
+            from tavily import TavilyClient
+            litellm_client = litellm
+            try:
+                tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+            except KeyError:
+                logging.error("Error initialising Tavily client. Missing API key?")
+                tavily_client = None
+            instructor_client = instructor.from_litellm(litellm.completion)
+            if fixtures_mode == "record":
+                from fixtures import recording_clients
+                litellm_client, tavily_client, instructor_client = recording_clients(fixtures_dir, litellm_client, tavily_client, instructor_client)
+            instructorlitellm_client = instructor_client  # set last: marks the clients as ready
 
 def _mock_instructorlitellm_client():
     # Implement mock functionality for instructorlitellm_client
@@ -52,6 +98,26 @@ def _mock_instructorlitellm_client():
                 return MockResponse()
     return MockInstructorLiteLLM()
 
+def _mock_litellm_client():
+    # Implement mock streaming functionality for litellm_client
+    # litellm chunk types (as in fixtures.ReplayLiteLLM), so that litellm.stream_chunk_builder can assemble them
+    class MockLiteLLM:
+        @staticmethod
+        def completion(**kwargs):
+            from litellm.types.utils import ModelResponseStream, StreamingChoices, Delta, Usage
+
+            content = 'Mock streamed response from litellm_client'
+            for word in content.split(' '):
+                time.sleep(0.5)
+                yield ModelResponseStream(model=kwargs.get("model"),
+                                          choices=[StreamingChoices(index=0, delta=Delta(content=word + ' ', role="assistant"))])
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in kwargs.get("messages", []))
+            completion_tokens = estimate_tokens(content)
+            yield ModelResponseStream(model=kwargs.get("model"), choices=[StreamingChoices(index=0, delta=Delta(content=None), finish_reason="stop")],
+                                      usage=Usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                                  total_tokens=prompt_tokens + completion_tokens))
+    return MockLiteLLM()
+
 def _mock_tavily_client():
     # Implement mock functionality for tavily_client
     class MockTavilyClient:
@@ -65,89 +131,412 @@ def _mock_tavily_client():
                     {'url': 'https://example3.com', 'content': 'Mock search result content 3'}
                 ]
             }
+
+        @staticmethod
+        def extract(urls, **kwargs):
+            time.sleep(1)
+            return {'results': [{'url': url, 'raw_content': f'Mock raw content of {url}'} for url in urls], 'failed_results': []}
     return MockTavilyClient()
 
-def prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None, **kwargs) -> str:
+def get_model_route(stage: str, step: Optional[Dict] = None) -> Dict:
     """
-    Calls the LLM API with the given prompt and returns the raw response as a string.
+    Get the model settings of a pipeline stage, see MODEL_ROUTES.
 
     Args:
-        prompt (str): The input prompt for the API.
-        max_tokens (int, optional): The maximum number of tokens in the response. Defaults to 1024.
-        role (str, optional): The role of the message sender. Defaults to "user".
-        response_model (optional): The response model to use. Defaults to None.
+        stage (str): "step", "condense", "summary", "draft_email" or "classify_industry".
+        step (Dict, optional): The workflow step; its "model", "temperature", "max_tokens" and "fallbacks" override
+            those of the step stage. Defaults to None.
 
     Returns:
-        str: The raw response from the LLM API.
+        Dict: model, temperature, max_tokens and fallbacks, as keyword arguments for cached_prompt_model.
     """
-    # Prepare parameters
+    route = dict(MODEL_ROUTES[stage])
+    if stage == "step" and step is not None:
+        route.update({key: step[key] for key in ("model", "temperature", "max_tokens", "fallbacks") if key in step})
+    return route
+
+def model_chain(model: str, fallbacks: List[str] = ()) -> List[str]:
+    # the models to try in order, without repeating one that already failed
+    return list(dict.fromkeys([model, *fallbacks]))
+
+def _build_params(prompt: str, max_tokens: int, role: str, **kwargs) -> Dict:
     params = {
         "model": MODEL_NAME,
         "max_tokens": max_tokens,
         "messages": [{"role": role, "content": prompt}],
-        "response_model": response_model,
         "temperature": TEMPERATURE,
         "top_p": TOP_P,
         "frequency_penalty": FREQUENCY_PENALTY,
-        "presence_penalty": PRESENCE_PENALTY
+        "presence_penalty": PRESENCE_PENALTY,
+        "timeout": LLM_TIMEOUT
     }
     params.update(kwargs)  # Add any additional kwargs
+    return params
 
-    # Log the parameters
-    logging.info(f"Parameters: {params}")
+def log_request(params: Dict):
+    # prompts run to tens of thousands of characters, so the main log only gets their size
+    prompt = params["messages"][0]["content"]
+    logging.info(f"LLM request to {params['model']}: prompt {len(prompt)} chars (~{estimate_tokens(prompt)} tokens), max_tokens {params['max_tokens']}")
+    audit_log("llm_request", params)
 
-    resp = instructorlitellm_client.chat.completions.create(**params)
+def log_response(content):
+    # as with requests, only the size (token usage is logged by _log_usage); the full response goes to the audit log
+    if isinstance(content, str):
+        logging.info(f"LLM response: {len(content)} chars (~{estimate_tokens(content)} tokens)")
+    else:
+        logging.info(f"LLM response: {type(content).__name__}")
 
+def _log_usage(resp):
     # Calculate and log token usage and cost
     input_tokens = resp.usage.prompt_tokens
     output_tokens = resp.usage.completion_tokens
     total_tokens = resp.usage.total_tokens
+    annotate(input_tokens=input_tokens, output_tokens=output_tokens)
     try:
+        from litellm import completion_cost
         cost = completion_cost(completion_response=resp)
+        annotate(cost=cost)
         logging.info(f"Token usage - Estimated cost: ${cost:.6f}, Input: {input_tokens}, Output: {output_tokens}, Total: {total_tokens}")
     except Exception as e:
         logging.error(f"Error calculating completion cost: {str(e)}")
         logging.info(f"Token usage - Input: {input_tokens}, Output: {output_tokens}, Total: {total_tokens}")
-    
-    # Log the response
-    logging.info(f"Response: {resp}")
+
+def stream_prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", **kwargs) -> Iterator[str]:
+    """
+    Calls the LLM API with streaming enabled and yields the response text as it arrives.
+
+    Args:
+        prompt (str): The input prompt for the API.
+        max_tokens (int, optional): The maximum number of tokens in the response. Defaults to 1024.
+        role (str, optional): The role of the message sender. Defaults to "user".
+
+    Yields:
+        str: The next piece of the response text.
+    """
+    _ensure_clients()
+    params = _build_params(prompt, max_tokens, role, **kwargs)
+    params["stream"] = True
+
+    # Log the parameters
+    log_request(params)
+
+    for attempt in range(MAX_RETRIES + 1):
+        has_output = False
+        try:
+            with limited(llm_limiter_names(params["model"]), estimate_tokens(prompt) + max_tokens) as permit:
+                annotate(rate_limit_wait=round(permit.waited, 3))
+                chunks = []
+                for chunk in litellm_client.completion(**params):
+                    chunks.append(chunk)
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        has_output = True
+                        yield delta
+
+                try:
+                    import litellm
+                    resp = litellm.stream_chunk_builder(chunks, messages=params["messages"])
+                    _log_usage(resp)
+                    permit.used_tokens = resp.usage.total_tokens
+                except Exception as e:
+                    logging.error(f"Error calculating token usage of stream: {str(e)}")
+            return
+        except Exception as e:
+            # once text has been handed out, a retry would duplicate it, so only retry before the first token
+            if has_output or attempt == MAX_RETRIES or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"LLM stream from {params['model']} failed ({type(e).__name__}), retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+def prompt_model(prompt: str, max_tokens: int = 1024, role: str = "user", response_model=None,
+                 on_partial: Optional[Callable[[str], None]] = None, hedge: bool = True, **kwargs) -> str:
+    """
+    Calls the LLM API with the given prompt and returns the raw response as a string.
+
+    Args:
+        prompt (str): The input prompt for the API.
+        max_tokens (int, optional): The maximum number of tokens in the response. Defaults to 1024.
+        role (str, optional): The role of the message sender. Defaults to "user".
+        response_model (optional): The response model to use. Defaults to None.
+        on_partial (Callable[[str], None], optional): If given (and no response_model), the response is streamed
+            and on_partial is called with the text received so far after every piece. Defaults to None.
+        hedge (bool, optional): With HEDGE_REQUESTS, race a slow call against FALLBACK_MODEL_NAME. Callers that key
+            the response by model (cache_utils.cached_prompt_model) pass False and hedge themselves. Defaults to True.
+
+    Returns:
+        str: The raw response from the LLM API.
+    """
+    with span("llm", model=kwargs.get("model", MODEL_NAME), streamed=on_partial is not None and response_model is None):
+        if on_partial is not None and response_model is None:
+            text = ""
+            for delta in stream_prompt_model(prompt, max_tokens, role, **kwargs):
+                text += delta
+                on_partial(text)
+            log_response(text)
+            audit_log("llm_response", text)
+            return text
+        return _prompt_model(prompt, max_tokens, role, response_model, hedge, **kwargs)
+
+def _prompt_model(prompt: str, max_tokens: int, role: str, response_model, hedge: bool, **kwargs) -> str:
+    # Prepare parameters
+    params = _build_params(prompt, max_tokens, role, response_model=response_model, **kwargs)
+
+    # Log the parameters
+    log_request(params)
+
+    def call(model: str):
+        return with_retries(lambda: _complete({**params, "model": model}), f"LLM call to {model}")
+
+    if hedge and HEDGE_REQUESTS and FALLBACK_MODEL_NAME and FALLBACK_MODEL_NAME != params["model"]:
+        resp = hedged_call(lambda: call(params["model"]), lambda: call(FALLBACK_MODEL_NAME),
+                           latency_tracker.hedge_delay(params["model"]), f"LLM call to {params['model']}")
+    else:
+        resp = call(params["model"])
+    return _parse_response(resp, response_model)
+
+def _complete(params: Dict):
+    # a single attempt: waits for the rate limiter, then records the provider latency for hedging decisions
+    _ensure_clients()
+    with limited(llm_limiter_names(params["model"]), estimate_tokens(params["messages"][0]["content"]) + params["max_tokens"]) as permit:
+        annotate(rate_limit_wait=round(permit.waited, 3))
+        start_time = time.monotonic()
+        resp = instructorlitellm_client.chat.completions.create(**params)
+        latency_tracker.record(params["model"], time.monotonic() - start_time)
+        permit.used_tokens = resp.usage.total_tokens
+    return resp
+
+def _parse_response(resp, response_model) -> str:
+    _log_usage(resp)
 
     if response_model is None:
-        return resp['choices'][0]['message']['content']
+        content = resp['choices'][0]['message']['content']
     else:
-        return resp.content
+        content = resp.content
 
-def run_step(step: Dict[str, str], company_url: str) -> str:
+    # Log the response
+    log_response(content)
+    audit_log("llm_response", resp)
+    return content
+
+def build_search_params(step: Dict[str, str], company_url: str) -> Dict:
     """
-    Run a single step of the workflow.
+    Build the Tavily search parameters for a workflow step; {company_url} in its query and include_domains is
+    replaced by the company ID, so every spelling of the URL shares one search (and cache entry).
 
     Args:
         step (Dict[str, str]): A dictionary containing step information.
         company_url (str): The URL of the company being analyzed.
 
     Returns:
-        str: The result of the step.
+        Dict: The search parameters.
     """
+    company_id = canonical_company_id(company_url)
     search_params = {
-        "query": step["search_query"].format(company_url=company_url),
+        "query": step["search_query"].format(company_url=company_id),
         "search_depth": "basic",
         "max_results": 5,
-        "include_raw_content": True
+        "include_raw_content": False  # raw content is fetched separately, once per page (see document_store.py)
     }
     
     if "include_domains" in step:
-        include_domains = [domain.format(company_url=company_url) for domain in step["include_domains"]]
+        include_domains = [domain.format(company_url=company_id) for domain in step["include_domains"]]
         search_params["include_domains"] = include_domains
 
-    search_results = tavily_client.search(**search_params)
-    
-    # Filter out file results
-    filtered_results = [result for result in search_results['results'] if not result['url'].lower().endswith(('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.rtf', '.csv', '.zip','.rar'))]
+    # blocked domains are excluded by the search itself, so they don't take up result slots
+    exclude_domains = sorted(set(BLOCKED_DOMAINS) | set(step.get("exclude_domains", [])))
+    if exclude_domains:
+        search_params["exclude_domains"] = exclude_domains
+    return search_params
+
+def search_web(search_params: Dict) -> Dict:
+    """
+    Run a Tavily search and drop file results.
+
+    Args:
+        search_params (Dict): The search parameters, see build_search_params.
+
+    Returns:
+        Dict: The filtered search results.
+    """
+    _ensure_clients()
+
+    def search():
+        with limited(["tavily"]) as permit:
+            annotate(rate_limit_wait=round(permit.waited, 3))
+            return tavily_client.search(**search_params, timeout=SEARCH_TIMEOUT)
+
+    with span("search", query=search_params["query"]) as search_span:
+        search_results = filter_search_results(search_params, with_retries(search, "Tavily search"))
+        search_span.attributes["results"] = len(search_results["results"])
+    return search_results
+
+def extract_pages(urls: List[str]) -> Dict[str, str]:
+    """
+    Fetch the raw content of web pages with Tavily extract, EXTRACT_BATCH_SIZE URLs per call.
+
+    Args:
+        urls (List[str]): The page URLs.
+
+    Returns:
+        Dict[str, str]: The raw content by URL; pages that couldn't be fetched are missing.
+    """
+    _ensure_clients()
+    pages = {}
+    with span("extract", urls=len(urls)) as extract_span:
+        for i in range(0, len(urls), EXTRACT_BATCH_SIZE):
+            batch = urls[i:i + EXTRACT_BATCH_SIZE]
+            def extract():
+                with limited(["tavily"]) as permit:
+                    annotate(rate_limit_wait=round(permit.waited, 3))
+                    return tavily_client.extract(urls=batch, timeout=SEARCH_TIMEOUT)
+            response = with_retries(extract, "Tavily extract")
+            pages.update({result["url"]: result.get("raw_content") or "" for result in response.get("results", [])})
+            for failed in response.get("failed_results", []):
+                logging.warning(f"Could not fetch {failed.get('url')}: {failed.get('error')}")
+        extract_span.attributes["fetched"] = len(pages)
+    logging.info(f"Fetched {len(pages)}/{len(urls)} pages: {[(url, len(raw_content)) for url, raw_content in pages.items()]}")
+    audit_log("extracted_pages", pages)
+    return pages
+
+def add_raw_content(search_results: Dict, pages: Dict[str, str]) -> Dict:
+    # attach fetched page content to search results that were retrieved without it
+    return {**search_results, "results": [{**result, "raw_content": pages[result["url"]]} if result["url"] in pages else result
+                                          for result in search_results["results"]]}
+
+def is_excluded_url(url: str, exclude_domains: List[str] = ()) -> bool:
+    """
+    Whether a search result should be dropped before its content is fetched: files (EXCLUDED_FILE_EXTENSIONS, also
+    with a query string) and pages on BLOCKED_DOMAINS or exclude_domains, including their subdomains.
+
+    Args:
+        url (str): The result URL.
+        exclude_domains (List[str], optional): Further domains to drop, e.g. the step's "exclude_domains". Defaults to ().
+
+    Returns:
+        bool: True if the result should be dropped.
+    """
+    parts = urlsplit(url)
+    if parts.path.lower().endswith(EXCLUDED_FILE_EXTENSIONS):
+        return True
+    host = (parts.hostname or "").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in (*BLOCKED_DOMAINS, *exclude_domains))
+
+def filter_search_results(search_params: Dict, search_results: Dict) -> Dict:
+    # Filter out file results and blocked domains; runs before any page content is fetched
+    filtered_results = [result for result in search_results['results'] if not is_excluded_url(result['url'], search_params.get("exclude_domains", []))]
+    if len(filtered_results) < len(search_results['results']):
+        logging.info(f"Dropped {len(search_results['results']) - len(filtered_results)} file or blocked results")
     search_results['results'] = filtered_results
 
-    # Log the search results
+    # Log the search results; only URLs and sizes here, raw content goes to the audit log
     logging.info(f"Search Parameters: {search_params}")
-    logging.info(f"Filtered Search Results: {search_results}")
-    
-    prompt = f"{step['prompt_to_analyse']}\n Base this on the following search results:\n {search_results}"
-    return prompt_model(prompt)
+    logging.info(f"Filtered Search Results: {[(result['url'], len(result.get('raw_content') or result.get('content') or '')) for result in search_results['results']]}")
+    audit_log("search_results", search_results)
+    return search_results
+
+def build_step_prompt(step: Dict[str, str], search_results: Dict) -> str:
+    """
+    Build the analysis prompt for a workflow step from its search results: the "top_k_passages" (defaults to
+    PASSAGE_TOP_K) passages most relevant to the step's search query and question, fitted into the step's
+    "context_token_budget" (defaults to CONTEXT_TOKEN_BUDGET).
+
+    Args:
+        step (Dict[str, str]): A dictionary containing step information.
+        search_results (Dict): The filtered search results, see search_web.
+
+    Returns:
+        str: The analysis prompt.
+    """
+    query = step["search_query"].replace("{company_url}", "") + " " + step["prompt_to_analyse"]
+    with span("build_context", step_name=step["step_name"]) as context_span:
+        context = build_context(search_results, step.get("context_token_budget", CONTEXT_TOKEN_BUDGET),
+                                query=query, top_k=step.get("top_k_passages", PASSAGE_TOP_K))
+        context_span.attributes["context_tokens"] = estimate_tokens(context)
+    return f"{step['prompt_to_analyse']}\n Base this on the following search results:\n {context}"
+
+def run_step(step: Dict[str, str], company_url: str) -> str:
+    """
+    Run a single step of the workflow.
+
+    Args:
+        step (Dict[str, str]): A dictionary containing step information.
+        company_url (str): The URL of the company being analyzed.
+
+    Returns:
+        str: The result of the step.
+    """
+    if step.get("scope") == "industry":  # no classification without the cache, so the company's own industry is researched
+        step = industry_step(step, canonical_company_id(company_url))
+    search_results = search_web(build_search_params(step, company_url))
+    search_results = add_raw_content(search_results, extract_pages([result["url"] for result in search_results["results"]]))
+    prompt = build_step_prompt(step, search_results)
+    route = get_model_route("step", step)
+    return with_fallbacks(lambda model: prompt_model(prompt, route["max_tokens"], model=model, temperature=route["temperature"]),
+                          model_chain(route["model"], route["fallbacks"]), f"Step {step['step_name']}")
+
+def build_condense_prompt(step: Dict[str, str], step_result: str) -> str:
+    """
+    Build the prompt that condenses a single step's result into short notes for the final summary.
+
+    Args:
+        step (Dict[str, str]): A dictionary containing step information.
+        step_result (str): The result of the step.
+
+    Returns:
+        str: The condense prompt.
+    """
+    return STEP_CONDENSE_PROMPT.format(step_name=step["step_name"]) + step_result
+
+def build_industry_prompt(overview: str) -> str:
+    """
+    Build the prompt that classifies a company into its industry, from the result of its overview step.
+
+    Args:
+        overview (str): The result of the step named in "industry_from".
+
+    Returns:
+        str: The classification prompt.
+    """
+    return INDUSTRY_CLASSIFICATION_PROMPT + overview
+
+def normalize_industry(industry: str) -> str:
+    # the sector key: first line, lowercase, without quotes, punctuation or a trailing "industry"; "" if unknown
+    lines = industry.strip().splitlines()
+    key = " ".join(re.sub(r"[^a-z0-9&+/ -]", " ", lines[0].lower()).split()) if lines else ""
+    key = re.sub(r"( industry| sector| market)$", "", key)[:60].strip()
+    return "" if key == "unknown" else key
+
+def get_step(step_name: str) -> Dict:
+    return next(step for step in WORKFLOW_STEPS if step["step_name"] == step_name)
+
+def industry_step(step: Dict, industry: str) -> Dict:
+    # the company-independent version of a "scope": "industry" step, run like any other step
+    sector_step = {key: value for key, value in step.items() if key not in ("scope", "industry_from", "sector_ttl")}
+    sector_step["search_query"] = step["search_query"].replace("{industry}", industry)
+    sector_step["prompt_to_analyse"] = step["prompt_to_analyse"].replace("{industry}", industry)
+    return sector_step
+
+def build_summary_prompt(step_results: List[str]) -> str:
+    """
+    Build the final summary prompt from the outputs of the workflow steps (or their condensed versions).
+
+    Args:
+        step_results (List[str]): The results of the workflow steps.
+
+    Returns:
+        str: The summary prompt.
+    """
+    return SUMMARY_BEGINNING_OF_PROMPT + "\n ***** \n" + "\n\n".join(step_results) + "\n ***** \n" + SUMMARY_END_OF_PROMPT
+
+def build_draft_email_prompt(summary: str) -> str:
+    """
+    Build the draft email prompt from the final summary.
+
+    Args:
+        summary (str): The final summary of the company.
+
+    Returns:
+        str: The draft email prompt.
+    """
+    return DRAFT_EMAIL_PROMPT + "\n ***** \n" + summary
@@ -0,0 +1,121 @@
+"""
+Cache warming for a watchlist of target companies.
+
+Once per day, in the off-peak hours WARM_CACHE_HOURS, runs the full workflow for every company in the watchlist
+(WATCHLIST_FILE, one company URL per line, re-read for every run), recomputing cached searches, documents and
+completions that would expire before the next warming (WARM_CACHE_REFRESH_WINDOW). Analysts opening one of these
+companies during the day then get cache hits throughout. Runs next to the app and workers, sharing CACHE_DIR; no new
+company is started once the off-peak window has ended.
+
+Usage:
+    python warm_cache.py [--watchlist watchlist.txt] [--once] [--max-workers 4] [--max-companies 2] [--mock]
+"""
+import time
+import signal
+import logging
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from model_config import WATCHLIST_FILE, WARM_CACHE_HOURS, WARM_CACHE_REFRESH_WINDOW, WARM_CACHE_CHECK_INTERVAL, METRICS_PORT
+from utils import initialize_clients
+from tracing import start_metrics_server
+from cache_utils import refresh_expiring, get_cache_stats
+from batch_runner import analyze_company, read_company_urls
+
+def in_warm_window(now: datetime.datetime, hours=WARM_CACHE_HOURS) -> bool:
+    start, end = hours
+    return start <= now.hour < end if start < end else now.hour >= start or now.hour < end
+
+def warm_window_date(now: datetime.datetime, hours=WARM_CACHE_HOURS) -> datetime.date:
+    # the day the current window started on, also for windows that wrap around midnight
+    return (now - datetime.timedelta(hours=hours[0])).date()
+
+def warm_companies(company_urls: List[str], max_workers: int, max_companies: int, stop: threading.Event,
+                   until_window_end: bool = True) -> int:
+    """
+    Run the workflow for the companies, refreshing cache entries that expire within WARM_CACHE_REFRESH_WINDOW.
+
+    Args:
+        company_urls (List[str]): The companies.
+        max_workers (int): Max. concurrent searches and completions.
+        max_companies (int): Max. companies in flight at the same time.
+        stop (threading.Event): Set to stop starting companies.
+        until_window_end (bool, optional): Also stop starting companies once the off-peak window has ended. Defaults to True.
+
+    Returns:
+        int: The number of companies warmed without errors.
+    """
+    def warm(company_url: str) -> bool:
+        if stop.is_set() or (until_window_end and not in_warm_window(datetime.datetime.now())):
+            return False
+        with refresh_expiring(WARM_CACHE_REFRESH_WINDOW):  # propagates to the executor threads via submit_traced
+            record = analyze_company(company_url, executor)
+        logging.info(f"Warmed {record['company_id']} in {record['elapsed_seconds']}s: {record['status']}")
+        return record["status"] == "ok"
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warm-call") as executor, \
+            ThreadPoolExecutor(max_workers=max_companies, thread_name_prefix="warm-company") as company_executor:
+        return sum(company_executor.map(warm, company_urls))
+
+def run_scheduler(watchlist: str, max_workers: int, max_companies: int, stop: threading.Event):
+    """
+    Warm the watchlist once per off-peak window until stop is set.
+
+    Args:
+        watchlist (str): Path to the watchlist file.
+        max_workers (int): Max. concurrent searches and completions.
+        max_companies (int): Max. companies in flight at the same time.
+        stop (threading.Event): Set to stop.
+    """
+    last_warmed = None
+    logging.info(f"Cache warming scheduled daily between {WARM_CACHE_HOURS[0]}:00 and {WARM_CACHE_HOURS[1]}:00 for {watchlist}")
+    while not stop.is_set():
+        now = datetime.datetime.now()
+        if in_warm_window(now) and warm_window_date(now) != last_warmed:
+            last_warmed = warm_window_date(now)
+            try:
+                company_urls = read_company_urls(watchlist)
+                start_time = time.time()
+                warmed = warm_companies(company_urls, max_workers, max_companies, stop)
+                logging.info(f"Cache warming finished: {warmed}/{len(company_urls)} companies in {time.time() - start_time:.0f}s, "
+                             f"cache statistics: {get_cache_stats()}")
+            except Exception as e:
+                logging.error(f"Error in cache warming: {str(e)}")
+        stop.wait(WARM_CACHE_CHECK_INTERVAL)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Refresh the cached results of a watchlist of companies in off-peak hours.")
+    parser.add_argument("--watchlist", default=WATCHLIST_FILE, help="text file with one company URL per line")
+    parser.add_argument("--once", action="store_true", help="warm the watchlist now, then exit (e.g. from cron)")
+    parser.add_argument("--max-workers", type=int, default=4, help="max. concurrent searches and completions")
+    parser.add_argument("--max-companies", type=int, default=2, help="max. companies in flight at the same time")
+    parser.add_argument("--mock", action="store_true", help="use mock clients instead of the real providers")
+    args = parser.parse_args(argv)
+
+    from env_config import setup_environment, setup_logging
+    setup_environment()
+    setup_logging()
+    initialize_clients(mock_clients=args.mock)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    stop = threading.Event()
+    def handle_signal(signum, frame):
+        if stop.is_set():  # second signal: exit now
+            raise KeyboardInterrupt
+        stop.set()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, handle_signal)
+
+    if args.once:
+        company_urls = read_company_urls(args.watchlist)
+        warmed = warm_companies(company_urls, args.max_workers, args.max_companies, stop, until_window_end=False)
+        logging.info(f"Cache warming finished: {warmed}/{len(company_urls)} companies, cache statistics: {get_cache_stats()}")
+    else:
+        run_scheduler(args.watchlist, args.max_workers, args.max_companies, stop)
+
+if __name__ == "__main__":
+    main()
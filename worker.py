@@ -0,0 +1,157 @@
+"""
+Worker process for the job queue: runs the step, summary and draft email jobs the UI submits (see job_queue.py).
+
+Start one or more next to the Streamlit app, sharing JOB_DB_PATH and CACHE_DIR; each runs up to --concurrency jobs
+in threads. On Ctrl+C/SIGTERM a worker stops claiming jobs and finishes the ones it is running; if it is killed
+instead, other workers requeue its jobs once its heartbeat is older than JOB_LEASE_SECONDS.
+
+Usage:
+    python worker.py [--concurrency 8] [--mock]
+"""
+import os
+import time
+import uuid
+import signal
+import socket
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional
+
+from workflow_steps import WORKFLOW_STEPS
+from utils import initialize_clients, build_summary_prompt, build_draft_email_prompt, get_model_route
+from model_config import STREAM_RESPONSES, INCREMENTAL_SUMMARY, METRICS_PORT, WORKER_CONCURRENCY, JOB_POLL_INTERVAL, \
+    JOB_LEASE_SECONDS, JOB_PARTIAL_INTERVAL
+from tracing import Trace, use_trace, span, start_metrics_server
+from cache_utils import cached_prompt_model, cached_run_step, cached_condense_step
+import job_queue
+
+ERROR_MESSAGES = {
+    "step": "Error occurred during step {step_index}.",
+    "summary": "Error occurred during summary generation.",
+    "draft_email": "Error occurred during draft email step.",
+}
+
+def _partial_writer(job: Dict, worker: str):
+    # streamed output is written at most every JOB_PARTIAL_INTERVAL seconds; the final result is stored by finish_job
+    last_write = 0.0
+    def write(text: str):
+        nonlocal last_write
+        if time.monotonic() - last_write >= JOB_PARTIAL_INTERVAL:
+            last_write = time.monotonic()
+            job_queue.update_partial(job["job_id"], worker, text)
+    return write if STREAM_RESPONSES else None
+
+def run_job(job: Dict, worker: str):
+    """
+    Run a claimed job and store its outcome.
+
+    Args:
+        job (Dict): The job, see job_queue.claim_job.
+        worker (str): This worker's ID.
+    """
+    kind, run_id = job["kind"], job["run_id"]
+    trace = Trace(job["company_url"])
+    on_partial = _partial_writer(job, worker)
+    status, result, condensed, error = "done", "", "", None
+    try:
+        with use_trace(trace):
+            if kind == "step":
+                step = WORKFLOW_STEPS[job["step_index"]]
+                result = cached_run_step(step, job["company_url"], on_partial=on_partial)
+                if INCREMENTAL_SUMMARY:  # condense right away, so the summary only has to reduce short notes
+                    try:
+                        condensed = cached_condense_step(step, result)
+                    except Exception as e:  # the step itself succeeded; the summary falls back to its full result
+                        logging.error(f"Error condensing step {step['step_name']} for {job['company_url']}: {str(e)}")
+            elif kind == "summary":
+                step_results = job_queue.get_step_results(run_id, len(WORKFLOW_STEPS), condensed=INCREMENTAL_SUMMARY)
+                if any(step_results):
+                    with span("summary"):
+                        result = cached_prompt_model(build_summary_prompt(step_results), on_partial=on_partial, **get_model_route("summary"))
+                else:
+                    status, error = "skipped", "No results to analyze."
+            else:
+                summary = job_queue.get_latest_result(run_id, "summary")
+                if summary:
+                    with span("draft_email"):
+                        result = cached_prompt_model(build_draft_email_prompt(summary), on_partial=on_partial,
+                                                     **get_model_route("draft_email"))
+                else:
+                    status, error = "skipped", "No summary to draft email from."
+    except Exception as e:
+        logging.error(f"Error in job {job['job_id']} ({job_queue.slot(job)}, run {run_id}): {str(e)}")
+        status, result, error = "failed", ERROR_MESSAGES[kind].format(step_index=job["step_index"]), str(e)
+    if not job_queue.finish_job(job["job_id"], worker, status, result, condensed, error, trace.to_list()):
+        logging.warning(f"Job {job['job_id']} was requeued while running; result discarded")
+    logging.info(f"Job {job['job_id']} ({job_queue.slot(job)}, run {run_id}) {status}")
+
+def _keep_leases(worker: str, stop: threading.Event):
+    # renews this worker's jobs and requeues those of workers that died
+    while not stop.wait(JOB_LEASE_SECONDS / 4):
+        try:
+            job_queue.heartbeat(worker)
+            requeued = job_queue.requeue_stale_jobs()
+            if requeued:
+                logging.warning(f"Requeued {requeued} jobs of lost workers")
+        except Exception as e:
+            logging.error(f"Error renewing job leases: {str(e)}")
+
+def run_worker(concurrency: int, stop: threading.Event, worker: Optional[str] = None):
+    """
+    Claim and run jobs until stop is set, then wait for the running ones.
+
+    Args:
+        concurrency (int): Max. jobs running at the same time.
+        stop (threading.Event): Set to stop claiming jobs.
+        worker (str, optional): The worker ID. Defaults to host, process ID and a random suffix.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    requeued = job_queue.requeue_stale_jobs()
+    logging.info(f"Worker {worker} started, {concurrency} concurrent jobs" + (f", requeued {requeued} stale jobs" if requeued else ""))
+    stop_leases = threading.Event()
+    threading.Thread(target=_keep_leases, args=(worker, stop_leases), daemon=True, name="job-leases").start()
+
+    running: List[Future] = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as executor:
+        while not stop.is_set():
+            running = [future for future in running if not future.done()]
+            job = None
+            if len(running) < concurrency:
+                try:
+                    job = job_queue.claim_job(worker)
+                except Exception as e:
+                    logging.error(f"Error claiming job: {str(e)}")
+            if job is None:
+                stop.wait(JOB_POLL_INTERVAL)
+                continue
+            logging.info(f"Job {job['job_id']} ({job_queue.slot(job)}, run {job['run_id']}) started for {job['company_url']}")
+            running.append(executor.submit(run_job, job, worker))
+        logging.info(f"Worker {worker} stopping, waiting for {sum(not future.done() for future in running)} running jobs")
+    stop_leases.set()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run jobs submitted by the company research app.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="max. jobs running at the same time")
+    parser.add_argument("--mock", action="store_true", help="use mock clients instead of the real providers")
+    args = parser.parse_args(argv)
+
+    from env_config import setup_environment, setup_logging
+    setup_environment()
+    setup_logging()
+    initialize_clients(mock_clients=args.mock)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    stop = threading.Event()
+    def handle_signal(signum, frame):
+        if stop.is_set():  # second signal: exit now; the running jobs are requeued after their lease expires
+            raise KeyboardInterrupt
+        stop.set()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, handle_signal)
+    run_worker(args.concurrency, stop)
+
+if __name__ == "__main__":
+    main()
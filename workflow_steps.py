@@ -1,39 +1,56 @@
+# Cache expiry (seconds) per step via "cache_ttl": short for fast-changing info such as news, long for stable info
+# Steps run on MODEL_ROUTES["step"] (see model_config.py) unless they set "model", "temperature", "max_tokens" or "fallbacks"
+# Steps with "scope": "industry" research the company's sector ({industry}, classified from the "industry_from" step's
+# result) instead of the company, and their result is shared by all companies in the sector for "sector_ttl"
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
 WORKFLOW_STEPS = [
     {
         "step_name": "Company Overview",
         "search_query": "{company_url} about OR mission OR products OR services",
         "prompt_to_analyse": "Summarize the key information about the company from its official website, including its mission, products/services, and any unique selling points.",
-        "include_domains": ["{company_url}"]
+        "include_domains": ["{company_url}"],
+        "cache_ttl": 4 * WEEK
     },
     {
         "step_name": "Founder Information",
         "search_query": "{company_url} founder OR CEO biography leadership team",
         "prompt_to_analyse": "Identify the founder(s) or CEO of the company and summarize their professional background, key achievements, and vision for the company.",
-        "include_domains": ["{company_url}", "linkedin.com", "crunchbase.com"]
+        "include_domains": ["{company_url}", "linkedin.com", "crunchbase.com"],
+        "cache_ttl": 2 * WEEK
     },
     {
         "step_name": "Industry Analysis",
-        "search_query": "{company_url} industry market report size growth trends 2024",
-        "prompt_to_analyse": "Analyze the industry in which the company operates. Summarize key statistics, growth projections, market size, and emerging trends for 2024 and beyond.",
-        "include_domains": ["statista.com", "marketresearch.com", "ibisworld.com", "grandviewresearch.com"]
+        "search_query": "{industry} industry market report size growth trends 2024",
+        "prompt_to_analyse": "Analyze the {industry} industry. Summarize key statistics, growth projections, market size, and emerging trends for 2024 and beyond.",
+        "include_domains": ["statista.com", "marketresearch.com", "ibisworld.com", "grandviewresearch.com"],
+        "cache_ttl": 4 * WEEK,
+        "scope": "industry",
+        "industry_from": "Company Overview",
+        "sector_ttl": 4 * WEEK
     },
     {
         "step_name": "Competitor Analysis",
         "search_query": "{company_url} top competitors comparison market share",
         "prompt_to_analyse": "Identify the top 3-5 competitors of the company. For each competitor, summarize their key offerings and unique selling points. Then, compare and contrast with the target company, highlighting key differentiators and relative market positions.",
-        "include_domains": []
+        "include_domains": [],
+        "cache_ttl": 2 * WEEK
     },
     {
         "step_name": "Customer Sentiment",
         "search_query": "{company_url} customer reviews testimonials case studies",
         "prompt_to_analyse": "Analyze customer reviews and testimonials for the company. Summarize the overall sentiment and extract common themes from both positive and negative reviews. Include any notable case studies or success stories if available.",
-        "include_domains": ["trustpilot.com", "g2.com", "capterra.com", "{company_url}"]
+        "include_domains": ["trustpilot.com", "g2.com", "capterra.com", "{company_url}"],
+        "cache_ttl": WEEK
     },
     {
         "step_name": "Recent Developments",
         "search_query": "{company_url} recent news announcements partnerships product launches achievements",
         "prompt_to_analyse": "Summarize the most significant recent news articles about the company, focusing on major announcements, partnerships, product launches, or achievements from the past 3 months.",
-        "include_domains": ["{company_url}", "techcrunch.com", "crunchbase.com", "businesswire.com", "prnewswire.com"]
+        "include_domains": ["{company_url}", "techcrunch.com", "crunchbase.com", "businesswire.com", "prnewswire.com"],
+        "cache_ttl": 6 * HOUR
     }
 ]
 
@@ -56,6 +73,22 @@ SUMMARY_BEGINNING_OF_PROMPT = """You're an analyst and think step-by-step.
         You've now been given the below information:
         \n**********"""
 
+STEP_CONDENSE_PROMPT = """You're an analyst preparing notes for a final company summary.
+
+        Task: condense the below research on "{step_name}" into its key facts and insights, as a short list of bullet points (max. 150 words).
+        Keep specific names, numbers, products, customers and dates; drop generic statements and anything not about this company or its market.
+
+        Only provide the bullet points; no pre-amble or closing language.
+        \n**********\n"""
+
+INDUSTRY_CLASSIFICATION_PROMPT = """You're a market research analyst.
+
+        Task: name the industry of the company described below, as a market research report would title it, in 2-4 words
+        (e.g. "HR software", "plant-based meat", "industrial IoT"). Prefer the established, broader name over a niche one,
+        so that similar companies get the same answer.
+        Only provide the industry name; if the description doesn't tell, answer "unknown".
+        \n**********\n"""
+
 SUMMARY_END_OF_PROMPT = """\n**********\n
         Remember your task and objective.
         """